@@ -0,0 +1,115 @@
+from pathlib import Path
+import polars as pl
+from parser import ConfigFileBasedParser
+
+ORDER_ID_PATTERN = r"\b([0-9D]\d{2}-\d{7}-\d{7})\b"
+AMAZON_PARTNER_PATTERN = r"(?i)amazon|amzn"
+
+
+class AmazonOrderIndex:
+    """
+    Index of the amazon orders (order id -> date, products and total) parsed from the amazon folder.
+
+    The parsed items of every file are persisted in cache_dir like the files of bank folders (see
+    Parser), so only new or changed files are parsed.
+    Files exported at different times overlap, so an item occurring n times in one file and m times in
+    another counts max(n, m) times, like transactions of the bank folders.
+    """
+
+    def __init__(self, folder: Path, cache_dir: Path):
+        self.folder = folder
+        self.cache_dir = cache_dir
+
+    def orders(self) -> pl.DataFrame:
+        items = self._items()
+        if "amount" not in items.columns:
+            items = items.with_columns(amount=pl.lit(None, dtype=pl.Float64))
+        # the account of amazon files is usually their file name, so it does not identify items
+        item_columns = [col for col in items.columns if col not in ["file", "account"]]
+
+        return (
+            items.group_by(*item_columns, "file")
+            .len()
+            .group_by(item_columns)
+            .agg(count=pl.col("len").max())
+            .group_by("amazon_order_id")
+            .agg(
+                date=pl.col("date").min().cast(pl.Date),
+                desc_order=pl.col("desc_order").unique().sort().str.join(", "),
+                total=(pl.col("amount") * pl.col("count")).sum().round(2),
+            )
+            .filter(pl.col("amazon_order_id").is_not_null())
+        )
+
+    def enrich(
+        self, transactions: pl.DataFrame | pl.LazyFrame, max_days: int = 30
+    ) -> pl.DataFrame | pl.LazyFrame:
+        """
+        Appends the products of the matching order to the desc of transactions.
+        A transaction matches the order whose id it contains, or else, if it is a payment to amazon,
+        the latest order within max_days before with a total equal to what was paid.
+
+        Both kinds of matches are done by a single join_asof on a common key: the order id, or the
+        paid amount if there is no order id. For order ids the dates are not compared.
+        """
+        orders = self.orders()
+        no_date = pl.lit(0, dtype=pl.Int32)
+        order_keys = pl.concat(
+            [
+                orders.select(
+                    "desc_order",
+                    match_key=pl.col("amazon_order_id"),
+                    match_date=no_date,
+                ),
+                orders.filter(pl.col("total").is_not_null()).select(
+                    "desc_order",
+                    match_key=pl.format("amount:{}", _cents(pl.col("total"))),
+                    match_date=pl.col("date").cast(pl.Int32),
+                ),
+            ]
+        ).sort("match_date")
+        if isinstance(transactions, pl.LazyFrame):
+            order_keys = order_keys.lazy()
+
+        order_id = pl.col("desc").str.extract(ORDER_ID_PATTERN)
+        is_amazon_payment = pl.col("partner").str.contains(AMAZON_PARTNER_PATTERN) & (
+            pl.col("amount") < 0
+        )
+        transaction_keys = transactions.with_row_index("_row").with_columns(
+            match_key=pl.when(order_id.is_not_null())
+            .then(order_id)
+            .when(is_amazon_payment)
+            .then(pl.format("amount:{}", _cents(-pl.col("amount")))),
+            match_date=pl.when(order_id.is_not_null())
+            .then(no_date)
+            .otherwise(pl.col("date").cast(pl.Int32)),
+        )
+
+        return (
+            transaction_keys.sort("match_date")
+            .join_asof(
+                order_keys,
+                on="match_date",
+                by="match_key",
+                strategy="backward",
+                tolerance=max_days,
+            )
+            .sort("_row")
+            .with_columns(
+                desc=pl.when(pl.col("desc_order").is_not_null())
+                .then(pl.col("desc") + " amazon_product:" + pl.col("desc_order"))
+                .otherwise(pl.col("desc"))
+            )
+            .drop("_row", "match_key", "match_date", "desc_order")
+        )
+
+    def _items(self) -> pl.DataFrame:
+        parser = ConfigFileBasedParser(self.folder, cache_dir=self.cache_dir)
+        return pl.concat(
+            items.drop("transaction_id").with_columns(file=pl.lit(name))
+            for name, items in parser.parse_files().items()
+        )
+
+
+def _cents(amount: pl.Expr) -> pl.Expr:
+    return (amount * 100).round(0).cast(pl.Int64)
@@ -1,7 +1,14 @@
+from concurrent.futures import ProcessPoolExecutor
+import html
+import multiprocessing
 from pathlib import Path
+import re
+from urllib.parse import quote
 import polars as pl
 import altair as alt
 from datetime import datetime
+from downsampling import end_of_period, largest_triangle_three_buckets
+from profiling import Measurement, trace
 
 
 class TransactionVisualizer:
@@ -11,12 +18,27 @@ class TransactionVisualizer:
         date_begin: datetime = datetime.min,
         date_end: datetime = datetime.max,
         account_pattern=".*",
+        balance_every: str | None = None,
+        max_points: int | None = None,
+        split: bool = False,
+        render_workers: int | None = None,
     ):
+        """
+        Balance plots can be downsampled to their balances at the end of every period balance_every
+        (e.g. "1w" or "1mo") and to at most max_points points per line.
+
+        If split, every plot is written to its own html file, rendered by render_workers processes
+        (defaults to the number of cores), together with an index.html linking them.
+        """
         alt.data_transformers.enable("vegafusion")
         self.transactions = transactions.sort("date")
         self.date_begin = date_begin
         self.date_end = date_end
         self.accounts_pattern = account_pattern
+        self.balance_every = balance_every
+        self.max_points = max_points
+        self.split = split
+        self.render_workers = render_workers
 
         self.data_filter = (
             pl.col("date") >= self.date_begin,
@@ -24,20 +46,92 @@ class TransactionVisualizer:
             pl.col("account").str.contains(self.accounts_pattern),
         )
 
-    def run(self, target_dir: Path):
-        self.get_combined_plots().save(
-            target_dir
-            / f"plot from {datetime.now().date()}, years {self.date_begin.year}-{self.date_end.year}, {self.transactions.filter(self.data_filter)["account"].unique().shape[0]} accounts.html"
+        # every plot reads from one of these, so the transactions are aggregated only once
+        self.cube = self.get_cube()
+        self.daily_balances = self.get_daily_balances()
+
+    def get_cube(self) -> pl.DataFrame:
+        """
+        Sum and count of the amounts of the filtered transactions per year, month, account and category.
+        """
+        return (
+            self.transactions.filter(self.data_filter)
+            .group_by(
+                year=pl.col("date").dt.year(),
+                month=pl.col("date").dt.month(),
+                account=pl.col("account"),
+                account1=pl.col("account1"),
+                account2=pl.col("account2"),
+            )
+            .agg(sum=pl.sum("amount"), count=pl.len())
+            .sort("year", "month", "account", "account1", "account2")
         )
 
-    def get_accountwise_balances_plot(self):
-        daily_balances_final = (
-            self.transactions.with_columns(
+    def get_daily_balances(self) -> pl.DataFrame:
+        """
+        Balance per account (account1) and of all accounts together at the end of every day with
+        transactions. The balances take all transactions into account, but only the days of the
+        filtered ones are kept.
+        """
+        return (
+            self.transactions.group_by("date", "account", "account1")
+            .agg(amount=pl.sum("amount"))
+            .sort("date", "account1")
+            .with_columns(
                 stand=pl.cum_sum("amount").over("account1"),
-                date=pl.col("date").cast(pl.Datetime),
+                stand_all=pl.cum_sum("amount"),
             )
-            .sort("account1", "date")
             .filter(self.data_filter)
+            .with_columns(date=pl.col("date").cast(pl.Datetime))
+        )
+
+    def downsample(self, balances: pl.DataFrame, by: list[str] = []) -> pl.DataFrame:
+        if self.balance_every is not None:
+            balances = end_of_period(balances, self.balance_every, by)
+        if self.max_points is not None:
+            balances = largest_triangle_three_buckets(balances, self.max_points, by)
+        return balances
+
+    def run(self, target_dir: Path):
+        name = f"plot from {datetime.now().date()}, years {self.date_begin.year}-{self.date_end.year}, {self.cube["account"].n_unique()} accounts"
+        if not self.split:
+            combined_plots = self.get_combined_plots()
+            with trace.span("render plots"):
+                combined_plots.save(target_dir / f"{name}.html")
+            return
+
+        plots_dir = target_dir / name
+        plots_dir.mkdir(parents=True, exist_ok=True)
+        plots = self.get_plots()
+        files = [plots_dir / f"{name}.html" for name in _file_names(list(plots))]
+        # polars is multi-threaded, so forking it may deadlock
+        with (
+            trace.span("render plots", workers=self.render_workers) as span,
+            ProcessPoolExecutor(
+                self.render_workers, mp_context=multiprocessing.get_context("spawn")
+            ) as executor,
+        ):
+            span["seconds per plot"] = dict(
+                zip(plots, executor.map(_save_plot, plots.values(), files))
+            )
+
+        with open(plots_dir / "index.html", "w", encoding="utf-8") as index:
+            index.write(
+                f'<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>{html.escape(name)}</title></head>\n<body>\n'
+                f"<h1>{html.escape(name)}</h1>\n<ul>\n"
+            )
+            for title, file in zip(plots, files):
+                index.write(
+                    f'<li><a href="{quote(file.name)}">{html.escape(title)}</a></li>\n'
+                )
+            index.write("</ul>\n</body>\n</html>\n")
+
+    def get_accountwise_balances_plot(self):
+        daily_balances_final = self.downsample(
+            self.daily_balances.select("date", "account1", "stand").sort(
+                "account1", "date"
+            ),
+            by=["account1"],
         )
 
         return (
@@ -62,13 +156,10 @@ class TransactionVisualizer:
         )
 
     def get_overall_balance_plot(self):
-        daily_balances_all_my_accounts = (
-            self.transactions.with_columns(
-                stand=pl.cum_sum("amount"),
-                date=pl.col("date").cast(pl.Datetime),
-            )
-            .sort("date")
-            .filter(self.data_filter)
+        daily_balances_all_my_accounts = self.downsample(
+            self.daily_balances.group_by("date", maintain_order=True)
+            .last()
+            .select("date", stand="stand_all")
         )
 
         return (
@@ -88,11 +179,9 @@ class TransactionVisualizer:
 
     def get_yearly_category_plot(self, accounts: list[str], indipendent_scale=True):
         daily_balances_categories = (
-            self.transactions.filter(self.data_filter)
-            .filter(pl.col("account").is_in(accounts))
-            .with_columns(year=pl.col("date").dt.year())
+            self.cube.filter(pl.col("account").is_in(accounts))
             .group_by("year", "account2")
-            .agg(stand=pl.sum("amount").abs().round(2))
+            .agg(stand=pl.sum("sum").abs().round(2))
             .sort("account2", "year")
         )
         plot = (
@@ -121,17 +210,55 @@ class TransactionVisualizer:
             plot = plot.resolve_scale(y="independent")
         return plot
 
-    def get_combined_plots(self):
-        bank_accounts = (
-            self.transactions.filter(self.data_filter)["account"].unique().to_list()
-        )
+    def get_plots(self) -> dict[str, alt.TopLevelMixin]:
+        bank_accounts = self.cube["account"].unique().sort().to_list()
 
-        plots = [
-            self.get_overall_balance_plot(),
-            self.get_accountwise_balances_plot(),
-            self.get_yearly_category_plot(accounts=bank_accounts),
-        ]
+        plot_functions = {
+            "overall balance": self.get_overall_balance_plot,
+            "balances per account": self.get_accountwise_balances_plot,
+            "categories of all accounts": lambda: self.get_yearly_category_plot(
+                accounts=bank_accounts
+            ),
+        }
         for account in bank_accounts:
-            plots.append(self.get_yearly_category_plot([account]))
+            plot_functions[f"categories of {account}"] = (
+                lambda account=account: self.get_yearly_category_plot([account])
+            )
+
+        plots = {}
+        for title, plot_function in plot_functions.items():
+            with trace.span(f"plot {title}"):
+                plots[title] = plot_function()
+        return plots
+
+    def get_combined_plots(self):
+        return alt.vconcat(*self.get_plots().values())
+
+
+def _file_names(titles: list[str]) -> list[str]:
+    """
+    Names for files of the given titles, without characters not allowed in file names.
+    Titles giving the same name, e.g. of accounts a:b and a/b, are numbered.
+    """
+    names = []
+    used = set()
+    for title in titles:
+        name = re.sub(r'[\\/:*?"<>|]', "_", title)
+        unique_name, number = name, 2
+        # file names are case-insensitive on windows and macos
+        while unique_name.lower() in used:
+            unique_name, number = f"{name} ({number})", number + 1
+        used.add(unique_name.lower())
+        names.append(unique_name)
+    return names
+
 
-        return alt.vconcat(*plots)
+def _save_plot(plot: alt.TopLevelMixin, file: Path) -> float:
+    """
+    Returns the seconds it took.
+    """
+    # runs in another process, which does not know the data transformer of this one
+    alt.data_transformers.enable("vegafusion")
+    with Measurement() as measurement:
+        plot.save(file)
+    return round(measurement.seconds, 6)
@@ -0,0 +1,172 @@
+from pathlib import Path
+import polars as pl
+
+checkpoint_schema = {
+    "account": pl.String,
+    "date": pl.Date,
+    "online_balance": pl.Float64,
+    "balance": pl.Float64,
+    "transactions": pl.UInt32,
+    "id_sum": pl.UInt64,
+    "agb": pl.Float64,
+    "correction": pl.Float64,
+}
+
+
+class BalanceCheckpoints:
+    """
+    Reconciles the transactions with the online balances and persists a checkpoint for every online
+    balance: the computed balance at its date, the difference to the online balance (agb) and the
+    correction needed compared to the previous checkpoint.
+
+    A checkpoint stays valid as long as the online balances up to it and the transactions up to its date
+    are unchanged. The latter is checked by their count and the (wrapping) sum of their transaction ids,
+    which identify their content. Balances are only computed from the last valid checkpoint onward.
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.checkpoints_file = cache_dir / "balance_checkpoints.parquet"
+
+    def corrections(
+        self, transactions: pl.DataFrame, online_balances: pl.DataFrame
+    ) -> pl.DataFrame:
+        """
+        Returns account, date and correction of every online balance.
+        """
+        old = self._load()
+        transactions_by_account = transactions.partition_by("account", as_dict=True)
+        checkpoints = [
+            self._account_checkpoints(
+                transactions_by_account.get((account,), transactions.clear()),
+                account_online_balances.sort("date"),
+                old.filter(pl.col("account") == account).sort("date"),
+            )
+            for (account,), account_online_balances in online_balances.partition_by(
+                "account", as_dict=True, maintain_order=True
+            ).items()
+        ]
+        new = (
+            pl.concat(checkpoints, how="vertical_relaxed")
+            if checkpoints
+            else pl.DataFrame(schema=checkpoint_schema)
+        )
+
+        self._report(old, new)
+        self.checkpoints_file.parent.mkdir(parents=True, exist_ok=True)
+        new.write_parquet(self.checkpoints_file)
+        return new.select("account", "date", "correction")
+
+    def _account_checkpoints(
+        self,
+        transactions: pl.DataFrame,
+        online_balances: pl.DataFrame,
+        old: pl.DataFrame,
+    ) -> pl.DataFrame:
+        reused = self._valid_checkpoints(transactions, online_balances, old)
+        start = reused.tail(1).to_dicts()[0] if len(reused) else None
+        if start is not None:
+            transactions = transactions.filter(pl.col("date") > start["date"])
+
+        daily_balances = (
+            transactions.group_by("date")
+            .agg(
+                amount=pl.col("amount").sum(),
+                transactions=pl.len(),
+                id_sum=pl.col("transaction_id").sum(),
+            )
+            .sort("date")
+            .select(
+                "date",
+                balance=pl.col("amount").cum_sum() + (start["balance"] if start else 0),
+                transactions=pl.col("transactions").cum_sum()
+                + (start["transactions"] if start else 0),
+                id_sum=pl.col("id_sum").cum_sum()
+                + pl.lit(start["id_sum"] if start else 0, dtype=pl.UInt64),
+            )
+        )
+
+        new = (
+            online_balances.slice(len(reused))
+            .select("account", "date", "online_balance")
+            .join_asof(daily_balances, on="date", strategy="backward")
+        )
+        if start is not None:
+            # no transactions since the last checkpoint
+            new = new.with_columns(
+                pl.col(col).fill_null(start[col])
+                for col in ["balance", "transactions", "id_sum"]
+            )
+
+        new = new.with_columns(
+            agb=(pl.col("online_balance") - pl.col("balance")).round(2)
+        ).with_columns(
+            correction=pl.col("agb")
+            - pl.col("agb")
+            .shift(1, fill_value=start["agb"] if start else 0)
+            .fill_null(0)
+        )
+        return pl.concat(
+            [reused, new.select(checkpoint_schema.keys()).cast(checkpoint_schema)]
+        )
+
+    def _valid_checkpoints(
+        self,
+        transactions: pl.DataFrame,
+        online_balances: pl.DataFrame,
+        old: pl.DataFrame,
+    ) -> pl.DataFrame:
+        """
+        Returns the old checkpoints that are still valid.
+        """
+        n = 0
+        for (date, online_balance), checkpoint in zip(
+            online_balances.select("date", "online_balance").iter_rows(),
+            old.iter_rows(named=True),
+        ):
+            if (date, online_balance) != (
+                checkpoint["date"],
+                checkpoint["online_balance"],
+            ):
+                break
+            n += 1
+
+        if n > 0:
+            checkpoint = old.row(n - 1, named=True)
+            until_checkpoint = transactions.filter(pl.col("date") <= checkpoint["date"])
+            # if the transactions changed before the last checkpoint, they may have before every other
+            if (len(until_checkpoint), until_checkpoint["transaction_id"].sum()) != (
+                checkpoint["transactions"] or 0,
+                checkpoint["id_sum"] or 0,
+            ):
+                n = 0
+
+        return old.head(n)
+
+    def _load(self) -> pl.DataFrame:
+        if not self.checkpoints_file.exists():
+            return pl.DataFrame(schema=checkpoint_schema)
+        return pl.read_parquet(self.checkpoints_file)
+
+    def _report(self, old: pl.DataFrame, new: pl.DataFrame):
+        if old.is_empty():
+            # e.g. the first run, where listing every checkpoint as changed tells nothing
+            print(f"    Computed {len(new)} balance checkpoints")
+            return
+
+        changed = (
+            old.join(
+                new, on=["account", "date"], how="full", coalesce=True, suffix="_new"
+            )
+            .filter(
+                pl.col("correction").ne_missing(pl.col("correction_new"))
+                | pl.col("online_balance").ne_missing(pl.col("online_balance_new"))
+            )
+            .sort("account", "date")
+        )
+        unchanged = len(new) - changed["online_balance_new"].is_not_null().sum()
+        print(f"    {unchanged} balance checkpoints unchanged, {len(changed)} changed")
+        for row in changed.iter_rows(named=True):
+            print(
+                f"        {row['account']} {row['date']}: correction {row['correction']}"
+                f" -> {row['correction_new']}"
+            )
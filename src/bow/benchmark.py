@@ -0,0 +1,382 @@
+from contextlib import redirect_stdout
+import io
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import argparse
+
+sys.path.append(str(Path(__file__).parent.absolute()))
+
+import numpy as np
+import polars as pl
+import yaml
+from profiling import Measurement
+from rules_applier import RulesApplier
+from rules_parser import RulesParser
+from runner import STAGES, Main
+
+BRANDS = [
+    "REWE",
+    "Lidl",
+    "Aldi",
+    "Edeka",
+    "Bauhaus",
+    "Obi",
+    "Stadtwerke",
+    "Telekom",
+    "Vodafone",
+    "Deutsche Bahn",
+    "Shell",
+    "Aral",
+    "Apotheke",
+    "Cafe",
+    "Baeckerei",
+    "Kino",
+    "Allianz",
+    "HUK",
+    "Netflix",
+    "Spotify",
+    "Decathlon",
+    "Ikea",
+    "Mediamarkt",
+    "Rossmann",
+    "DM",
+]
+DESC_WORDS = [
+    "Lastschrift",
+    "Kartenzahlung",
+    "Dauerauftrag",
+    "Gutschrift",
+    "Miete",
+    "Beitrag",
+    "Rechnung",
+    "Abo",
+    "Einkauf",
+    "Erstattung",
+]
+AMAZON_PARTNER = "AMAZON EU S.A R.L."
+
+bank_parser_config = {
+    "read_csv": {"separator": ";", "decimal_comma": True, "null_values": [""]},
+    "rename": {
+        "date": "Buchungsdatum",
+        "classification": "Umsatztyp",
+        "amount": "Betrag",
+        "desc": "Verwendungszweck",
+        "partner_iban": "IBAN",
+    },
+    "date_format": "%d.%m.%Y",
+    "partner_settings": {
+        "partner_column_if_amount_negative": "Empfaenger",
+        "partner_column_if_amount_positive": "Zahlungspflichtiger",
+    },
+}
+amazon_parser_config = {
+    "expected_out_columns": [
+        "date",
+        "account",
+        "desc_order",
+        "amazon_order_id",
+        "amount",
+    ],
+    "read_csv": {"try_parse_dates": True},
+    "pre_rename": {"lower_columns": True, "strip_spaces": True},
+    "rename": {
+        "date": "orderdate",
+        "desc_order": "productname",
+        "amazon_order_id": "orderid",
+        "amount": "totalowed",
+    },
+    "account_settings": {"account_name_is_file_name": True},
+}
+
+
+def generate_workspace(
+    working_dir: Path,
+    transactions: int,
+    banks: int = 3,
+    rules: int = 200,
+    exports_per_bank: int = 4,
+    overlap: float = 0.1,
+    seed: int = 0,
+):
+    """
+    Creates a workspace with the given number of transactions in total, spread over bank folders whose
+    csv exports overlap by the given fraction of their rows, like repeated downloads from online banking.
+
+    Partners are drawn from a skewed distribution, such that a few rules match most transactions and
+    some partners match no rule. About 2% of the transactions are amazon payments with matching orders,
+    and online_balances.csv contains the balance of every bank at the end of every year.
+    """
+    rng = np.random.default_rng(seed)
+    partners = [
+        f"{BRANDS[i % len(BRANDS)]} {i // len(BRANDS)}"
+        for i in range(max(rules * 2, 50))
+    ]
+    online_balances = []
+    orders = []
+
+    for bank in range(banks):
+        n = transactions // banks + (bank < transactions % banks)
+        account = f"Bank {bank}"
+        df = _generate_transactions(rng, n, partners).with_columns(
+            Umsatztyp=pl.when(pl.col("amount") < 0)
+            .then(pl.lit("Ausgang"))
+            .otherwise(pl.lit("Eingang"))
+        )
+        orders.append(
+            df.filter(pl.col("order_id").is_not_null()).select(
+                pl.col("date").cast(pl.Datetime).alias("Order Date"),
+                pl.col("order_id").alias("Order ID"),
+                pl.format("Product {}", pl.col("order_id").str.slice(-4)).alias(
+                    "Product Name"
+                ),
+                (-pl.col("amount")).alias("Total Owed"),
+            )
+        )
+        year_ends = (
+            df.with_columns(balance=pl.col("amount").cum_sum())
+            .group_by(year=pl.col("date").dt.year(), maintain_order=True)
+            .last()
+        )
+        online_balances.append(
+            year_ends.select(
+                date=pl.date("year", 12, 31),
+                account=pl.lit(account),
+                # a few balances are off, such that corrections are computed
+                online_balance=(
+                    pl.col("balance") + rng.choice([0.0, 0.0, 0.0, 5.0], len(year_ends))
+                ).round(2),
+            )
+        )
+
+        folder = working_dir / "1_imports" / "bank" / f"bank{bank}"
+        folder.mkdir(parents=True, exist_ok=True)
+        _write_yaml(
+            folder / "parser_config.yml",
+            {**bank_parser_config, "account_settings": {"account_name": account}},
+        )
+        export = df.select(
+            Buchungsdatum=pl.col("date").dt.strftime("%d.%m.%Y"),
+            Umsatztyp="Umsatztyp",
+            Betrag=pl.col("amount")
+            .round(2)
+            .cast(pl.String)
+            .str.replace(".", ",", literal=True),
+            Verwendungszweck="desc",
+            IBAN="iban",
+            Empfaenger=pl.when(pl.col("amount") < 0).then("partner"),
+            Zahlungspflichtiger=pl.when(pl.col("amount") >= 0).then("partner"),
+        )
+        edges = np.linspace(0, n, exports_per_bank + 1).astype(int)
+        for i, (start, end) in enumerate(zip(edges[:-1], edges[1:])):
+            extra = int((end - start) * overlap)
+            export.slice(max(start - extra, 0), end - start + 2 * extra).write_csv(
+                folder / f"export {i}.csv", separator=";"
+            )
+
+    amazon_folder = working_dir / "1_imports" / "amazon"
+    amazon_folder.mkdir(parents=True, exist_ok=True)
+    _write_yaml(amazon_folder / "parser_config.yml", amazon_parser_config)
+    pl.concat(orders).write_csv(amazon_folder / "orders.csv")
+    pl.concat(online_balances).write_csv(
+        working_dir / "1_imports" / "online_balances.csv"
+    )
+
+    rules_folder = working_dir / "2_rules"
+    rules_folder.mkdir(parents=True, exist_ok=True)
+    _write_yaml(rules_folder / "generated.yml", _generate_rules(rng, rules, partners))
+
+
+def _generate_transactions(
+    rng: np.random.Generator, n: int, partners: list[str]
+) -> pl.DataFrame:
+    days = np.sort(rng.integers(0, 3650, n))
+    # zipf-like, such that a few partners occur in most transactions
+    partner_index = np.minimum(rng.zipf(1.3, n) - 1, len(partners) - 1)
+    is_income = rng.random(n) < 0.1
+
+    order_id = pl.when("is_amazon").then(
+        pl.format(
+            "302-{}-{}",
+            pl.col("order_part1").cast(pl.String).str.zfill(7),
+            pl.col("order_part2").cast(pl.String).str.zfill(7),
+        )
+    )
+    return pl.DataFrame(
+        {
+            "date": np.datetime64("2015-01-01") + days.astype("timedelta64[D]"),
+            "partner": pl.Series(partners).gather(partner_index),
+            "desc_word": pl.Series(DESC_WORDS).gather(
+                rng.integers(0, len(DESC_WORDS), n)
+            ),
+            "ref": rng.integers(0, 10**6, n),
+            "amount": np.where(
+                is_income, rng.lognormal(7, 0.5, n), -rng.lognormal(3, 1, n)
+            ).round(2),
+            "is_amazon": ~is_income & (rng.random(n) < 0.02),
+            "order_part1": rng.integers(0, 10**7, n),
+            "order_part2": rng.integers(0, 10**7, n),
+            "iban": rng.integers(0, 10**8, n),
+        }
+    ).select(
+        pl.col("date").cast(pl.Date),
+        "amount",
+        partner=pl.when("is_amazon").then(pl.lit(AMAZON_PARTNER)).otherwise("partner"),
+        order_id=order_id,
+        iban=pl.format("DE00{}", "iban"),
+        desc=pl.when("is_amazon")
+        .then(pl.format("{} Amazon order", order_id))
+        .otherwise(pl.format("{} {}", "desc_word", "ref")),
+    )
+
+
+def _generate_rules(rng: np.random.Generator, rules: int, partners: list[str]) -> dict:
+    """
+    Rules on partners, descriptions or all fields, some of them restricted to expenses.
+    The last tenth of the partners is matched by no rule.
+    """
+    generated = [{"category": "expenses:amazon", "partner": "amazon"}]
+    for i in range(rules - 1):
+        kind = str(rng.choice(["partner", "desc", "base"], p=[0.7, 0.2, 0.1]))
+        if kind == "desc":
+            pattern = f"{DESC_WORDS[i % len(DESC_WORDS)].lower()} {rng.integers(0, 10)}"
+        else:
+            names = rng.choice(partners[: len(partners) * 9 // 10], rng.integers(1, 4))
+            pattern = "|".join(f"^{str(name).lower()}$" for name in names)
+        rule = {"category": f"expenses:category{i % 40}", kind: pattern}
+        if rng.random() < 0.5:
+            rule["amount"] = "^[-].*"
+        generated.append(rule)
+    return {"rules": generated}
+
+
+def _write_yaml(file: Path, content: dict):
+    with open(file, "w", encoding="utf-8") as stream:
+        yaml.safe_dump(content, stream, allow_unicode=True, sort_keys=False)
+
+
+def run_benchmark(
+    working_dir: Path,
+    transactions: int,
+    banks: int = 3,
+    rules: int = 200,
+    legacy_rows: int = 10_000,
+    verbose: bool = False,
+) -> pl.DataFrame:
+    """
+    Generates a workspace and measures wall time and peak memory of every stage of runner.Main,
+    of RulesApplier.apply on all and apply_legacy on legacy_rows transactions, and of importing again
+    from the parse cache.
+    """
+    generate_workspace(working_dir, transactions, banks, rules)
+    main = Main(working_dir, stages=STAGES)
+    measurements = []
+
+    def measure(name: str, function, rows: int):
+        with redirect_stdout(sys.stdout if verbose else io.StringIO()):
+            with Measurement() as measurement:
+                result = function()
+        measurements.append(
+            {
+                "transactions": transactions,
+                "step": name,
+                "rows": rows,
+                "seconds": round(measurement.seconds, 3),
+                "peak_rss_mb": (
+                    None
+                    if measurement.peak_rss is None
+                    else round(measurement.peak_rss / 2**20)
+                ),
+                "added_rss_mb": (
+                    None
+                    if measurement.start_rss is None
+                    else round((measurement.peak_rss - measurement.start_rss) / 2**20)
+                ),
+            }
+        )
+        print(f"    {name}: {measurement.seconds:.3f} s")
+        return result
+
+    imported = measure("import", main._1_import, transactions)
+    measure("import (cached)", main._1_import, len(imported))
+
+    applier = RulesApplier(RulesParser().parse(working_dir / "2_rules"))
+    measure("RulesApplier.apply", lambda: applier.apply(imported), len(imported))
+    sample = imported.head(legacy_rows)
+    measure(
+        "RulesApplier.apply_legacy", lambda: applier.apply_legacy(sample), len(sample)
+    )
+
+    categorized = measure("rules", lambda: main._2_rules(imported), len(imported))
+    manual = measure("manual", lambda: main._3_manual(categorized), len(imported))
+    measure("output", lambda: main._4_output(manual), len(manual))
+    measure("analyze", lambda: main._5_analyze(manual), len(manual))
+
+    return pl.DataFrame(measurements)
+
+
+parser = argparse.ArgumentParser(
+    description="Benchmarks the stages of bow on generated workspaces."
+)
+parser.add_argument(
+    "--transactions",
+    type=int,
+    nargs="+",
+    default=[10_000, 1_000_000],
+    help="number of transactions of every generated workspace, e.g. 10000 1000000 10000000",
+)
+parser.add_argument("--banks", type=int, default=3, help="number of bank folders")
+parser.add_argument("--rules", type=int, default=200, help="number of rules")
+parser.add_argument(
+    "--legacy-rows",
+    type=int,
+    default=10_000,
+    help="number of transactions to benchmark the slow RulesApplier.apply_legacy on",
+)
+parser.add_argument(
+    "--folder",
+    help="folder to generate the workspaces in, kept afterwards (default: a temporary folder)",
+)
+parser.add_argument("--output", help="csv file to write the measurements to")
+parser.add_argument("--verbose", action="store_true", help="show the output of bow")
+
+
+def main():
+    args = parser.parse_args()
+    root = (
+        Path(args.folder)
+        if args.folder
+        else Path(tempfile.mkdtemp(prefix="bow_benchmark_"))
+    )
+
+    results = []
+    try:
+        for transactions in args.transactions:
+            print(f"Benchmarking {transactions} transactions..")
+            working_dir = root / f"{transactions} transactions"
+            shutil.rmtree(working_dir, ignore_errors=True)
+            results.append(
+                run_benchmark(
+                    working_dir,
+                    transactions,
+                    args.banks,
+                    args.rules,
+                    args.legacy_rows,
+                    args.verbose,
+                )
+            )
+    finally:
+        if not args.folder:
+            shutil.rmtree(root, ignore_errors=True)
+
+    results = pl.concat(results)
+    with pl.Config(tbl_rows=-1, tbl_hide_dataframe_shape=True):
+        print(results)
+    if args.output:
+        results.write_csv(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import json
+from pathlib import Path
+import polars as pl
+from file_cache import POLARS_HASH_VERSION
+from parser import bank_transaction_columns
+from rules_applier import RulesApplier
+
+
+class CategoryCache:
+    """
+    Persists which rule categorized which transaction, such that subsequent runs only have to
+    categorize new transactions and those an added, removed or edited rule could affect.
+
+    A transaction is identified by its transaction_id together with a fingerprint of its content,
+    since e.g. the amazon enrichment can change a transaction without changing its id.
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.categories_file = cache_dir / "categories.parquet"
+        self.meta_file = cache_dir / "categories.json"
+
+    def apply(self, applier: RulesApplier, data: pl.DataFrame) -> pl.DataFrame:
+        rule_fingerprints = self._rule_fingerprints(applier)
+        data = data.with_columns(
+            _fingerprint=pl.struct(bank_transaction_columns).hash()
+        )
+        cached, cached_rule_fingerprints = self._load()
+
+        if cached is None or not self._rule_order_kept(
+            cached_rule_fingerprints, rule_fingerprints
+        ):
+            print("    No usable category cache, applying rules to all transactions")
+            rule_index = applier.rule_indices(data)
+        else:
+            rule_index = self._apply_incremental(
+                applier, data, cached, set(cached_rule_fingerprints), rule_fingerprints
+            )
+
+        self._save(data, rule_index, rule_fingerprints)
+        return applier.categorize(data, rule_index).drop("_fingerprint")
+
+    def _apply_incremental(
+        self,
+        applier: RulesApplier,
+        data: pl.DataFrame,
+        cached: pl.DataFrame,
+        cached_rule_fingerprints: set[str],
+        rule_fingerprints: list[str],
+    ) -> pl.Series:
+        added = [
+            i
+            for i, fingerprint in enumerate(rule_fingerprints)
+            if fingerprint not in cached_rule_fingerprints
+        ]
+        removed = cached_rule_fingerprints - set(rule_fingerprints)
+
+        known = data.join(
+            cached.with_columns(_cached=pl.lit(True)),
+            on=["transaction_id", "_fingerprint"],
+            how="left",
+        )
+        affected = (
+            known["_cached"].is_null()
+            | known["_rule"].is_in(list(removed)).fill_null(False)
+        ).alias("affected")
+
+        if added:
+            added_rules = RulesApplier([applier.rules[i] for i in added])
+            matched_by_added = added_rules.rule_indices(data.filter(~affected))
+            affected = affected.scatter(
+                affected.not_().arg_true().filter(matched_by_added.is_not_null()), True
+            )
+
+        rule_index = known["_rule"].replace_strict(
+            rule_fingerprints,
+            list(range(len(rule_fingerprints))),
+            default=None,
+            return_dtype=pl.UInt32,
+        )
+        rule_index = rule_index.scatter(
+            affected.arg_true(), applier.rule_indices(data.filter(affected))
+        )
+
+        print(
+            f"    Applied rules to {affected.sum()} new or affected transactions, "
+            f"took {len(data) - affected.sum()} categories from cache"
+        )
+        return rule_index
+
+    def _rule_fingerprints(self, applier: RulesApplier) -> list[str]:
+        """
+        Identical rules are distinguished by their occurrence.
+        """
+        occurrences = {}
+        fingerprints = []
+        for rule in applier.rules:
+            fingerprint = rule.fingerprint()
+            occurrences[fingerprint] = occurrences.get(fingerprint, -1) + 1
+            fingerprints.append(f"{fingerprint}:{occurrences[fingerprint]}")
+        return fingerprints
+
+    def _rule_order_kept(self, old: list[str], new: list[str]) -> bool:
+        """
+        Rules that exist before and after must keep their order, otherwise first-match results of
+        transactions not touched by added or removed rules could change as well.
+        """
+        old_set, new_set = set(old), set(new)
+        return [f for f in old if f in new_set] == [f for f in new if f in old_set]
+
+    def _load(self) -> tuple[pl.DataFrame | None, list[str]]:
+        if not self.categories_file.exists() or not self.meta_file.exists():
+            return None, []
+
+        with open(self.meta_file, encoding="utf-8") as file:
+            meta = json.load(file)
+
+        if meta.get("polars_version") != POLARS_HASH_VERSION:
+            return None, []
+
+        cached = pl.read_parquet(self.categories_file).unique(
+            ["transaction_id", "_fingerprint"]
+        )
+        return cached, meta["rules"]
+
+    def _save(
+        self, data: pl.DataFrame, rule_index: pl.Series, rule_fingerprints: list[str]
+    ):
+        self.categories_file.parent.mkdir(exist_ok=True, parents=True)
+        data.select(
+            "transaction_id",
+            "_fingerprint",
+            _rule=pl.lit(pl.Series(rule_fingerprints, dtype=pl.String)).gather(
+                rule_index
+            ),
+        ).write_parquet(self.categories_file)
+
+        with open(self.meta_file, "w", encoding="utf-8") as file:
+            json.dump(
+                {"polars_version": POLARS_HASH_VERSION, "rules": rule_fingerprints},
+                file,
+            )
@@ -0,0 +1,70 @@
+import numpy as np
+import polars as pl
+
+
+def end_of_period(
+    series: pl.DataFrame, every: str, by: list[str] = [], x: str = "date"
+) -> pl.DataFrame:
+    """
+    Keeps the last row of every period (e.g. "1w" or "1mo", see polars.Expr.dt.truncate) of each series.
+    The series have to be sorted by x.
+    """
+    return (
+        series.group_by(
+            *by, pl.col(x).dt.truncate(every).alias("_period"), maintain_order=True
+        )
+        .last()
+        .drop("_period")
+    )
+
+
+def largest_triangle_three_buckets(
+    series: pl.DataFrame,
+    max_points: int,
+    by: list[str] = [],
+    x: str = "date",
+    y: str = "stand",
+) -> pl.DataFrame:
+    """
+    Reduces each series to at most max_points rows with the "largest triangle three buckets" algorithm
+    (Steinarsson 2013): the first and last point are kept, the others are split into buckets and of every
+    bucket the point spanning the largest triangle with the previously kept point and the average of
+    the next bucket is kept. Peaks and drops therefore survive, unlike with averaging or striding.
+    The series have to be sorted by x.
+    """
+    if by:
+        parts = series.partition_by(by, maintain_order=True)
+        return pl.concat(
+            [
+                largest_triangle_three_buckets(part, max_points, [], x, y)
+                for part in parts
+            ]
+        )
+
+    # the first and the last point plus at least one bucket
+    max_points = max(max_points, 3)
+    if len(series) <= max_points:
+        return series
+
+    xs = series[x].to_physical().cast(pl.Float64).to_numpy()
+    ys = series[y].cast(pl.Float64).to_numpy()
+    # buckets for all but the first and last point
+    bucket_edges = np.linspace(1, len(series) - 1, max(max_points - 1, 2)).astype(int)
+
+    kept = [0]
+    for i, (start, end) in enumerate(zip(bucket_edges[:-1], bucket_edges[1:])):
+        if i + 2 < len(bucket_edges):
+            next_start, next_end = end, bucket_edges[i + 2]
+        else:
+            next_start, next_end = len(series) - 1, len(series)
+        next_x, next_y = xs[next_start:next_end].mean(), ys[next_start:next_end].mean()
+
+        previous_x, previous_y = xs[kept[-1]], ys[kept[-1]]
+        areas = np.abs(
+            (previous_x - next_x) * (ys[start:end] - previous_y)
+            - (previous_x - xs[start:end]) * (next_y - previous_y)
+        )
+        kept.append(start + int(areas.argmax()))
+    kept.append(len(series) - 1)
+
+    return series[kept]
@@ -0,0 +1,49 @@
+from contextlib import contextmanager
+import hashlib
+from pathlib import Path
+from typing import Iterator
+import polars as pl
+
+# hashes of polars are only stable within the same version,
+# so files storing them are tagged with it
+POLARS_HASH_VERSION = pl.__version__
+
+
+def cache_file(cache_dir: Path, file: Path, parts: list[str], suffix: str) -> Path:
+    """
+    File in cache_dir for what is derived from the given file, named by a hash of its
+    name, its content and the parts, e.g. versions and configuration the result
+    depends on.
+    """
+    key = hashlib.sha256()
+    for part in [file.name, *parts]:
+        key.update(part.encode("utf-8"))
+        key.update(b"\0")
+    with open(file, "rb") as f:
+        # in chunks, such that large files are not read into memory as a whole
+        key.update(hashlib.file_digest(f, "sha256").digest())
+    return cache_dir / f"{key.hexdigest()}{suffix}"
+
+
+@contextmanager
+def writing(cache_file: Path) -> Iterator[Path]:
+    """
+    Yields the path to write the cache file to. It is written under another name first
+    and moved into place afterwards, such that an interrupted run leaves no broken file.
+    """
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    temp_file = cache_file.with_suffix(".tmp")
+    yield temp_file
+    temp_file.replace(cache_file)
+
+
+def remove_unused(cache_dir: Path | None, used: list[Path | None], pattern: str = "*"):
+    """
+    Removes the cache files not used anymore, e.g. those of files that changed or no
+    longer exist.
+    """
+    if cache_dir is None or not cache_dir.exists():
+        return
+    for cache_file in cache_dir.glob(pattern):
+        if cache_file not in used:
+            cache_file.unlink()
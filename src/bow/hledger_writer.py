@@ -0,0 +1,109 @@
+import hashlib
+import json
+from pathlib import Path
+import polars as pl
+from file_cache import POLARS_HASH_VERSION
+
+
+class HledgerWriter:
+    """
+    Writes the categorized transactions as hledger journal, one file <year>.journal per year and a
+    main.journal including all of them.
+
+    Every transaction books its amount on account1 and the counterpart on account2, just like
+    importing output.csv with the rules described in the README would. Years whose transactions did not
+    change are not touched, years with transactions only added at their end are appended to.
+    What was written is remembered in manifest.json.
+    """
+
+    def __init__(self, target_dir: Path, currency: str = "€", chunk_size: int = 50_000):
+        self.target_dir = target_dir
+        self.currency = currency
+        self.chunk_size = chunk_size
+        self.manifest_file = target_dir / "manifest.json"
+
+    def write(self, transactions: pl.DataFrame):
+        self.target_dir.mkdir(parents=True, exist_ok=True)
+        manifest = self._load_manifest()
+        years = {}
+
+        transactions = transactions.with_columns(year=pl.col("date").dt.year()).sort(
+            "date", "transaction_id"
+        )
+        for (year,), transactions_of_year in transactions.partition_by(
+            "year", as_dict=True, maintain_order=True
+        ).items():
+            journal = self.target_dir / f"{year}.journal"
+            row_hashes = (
+                transactions_of_year.drop("year").hash_rows().to_numpy().tobytes()
+            )
+            written = manifest["years"].get(str(year))
+            years[str(year)] = {
+                "rows": len(transactions_of_year),
+                "hash": hashlib.sha256(row_hashes).hexdigest(),
+            }
+
+            if not journal.exists() or written is None:
+                self._write_journal(journal, transactions_of_year, "w")
+            elif written == years[str(year)]:
+                continue
+            elif written["rows"] < len(transactions_of_year) and (
+                hashlib.sha256(row_hashes[: 8 * written["rows"]]).hexdigest()
+                == written["hash"]
+            ):
+                self._write_journal(
+                    journal, transactions_of_year.slice(written["rows"]), "a"
+                )
+            else:
+                self._write_journal(journal, transactions_of_year, "w")
+
+        for year in set(manifest["years"]) - set(years):
+            (self.target_dir / f"{year}.journal").unlink(missing_ok=True)
+
+        with open(self.target_dir / "main.journal", "w", encoding="utf-8") as file:
+            file.writelines(f"include {year}.journal\n" for year in sorted(years))
+
+        with open(self.manifest_file, "w", encoding="utf-8") as file:
+            json.dump({"polars_version": POLARS_HASH_VERSION, "years": years}, file)
+
+    def _load_manifest(self) -> dict:
+        if not self.manifest_file.exists():
+            return {"years": {}}
+        with open(self.manifest_file, encoding="utf-8") as file:
+            manifest = json.load(file)
+        if manifest.get("polars_version") != POLARS_HASH_VERSION:
+            return {"years": {}}
+        return manifest
+
+    def _write_journal(self, journal: Path, transactions: pl.DataFrame, mode: str):
+        print(f"    Writing {len(transactions)} transactions to {journal.name}..")
+        with open(journal, mode, encoding="utf-8") as file:
+            for offset in range(0, len(transactions), self.chunk_size):
+                entries = transactions.slice(offset, self.chunk_size).select(
+                    self._entry_expression()
+                )
+                file.write("".join(entries.to_series()))
+
+    def _entry_expression(self) -> pl.Expr:
+        description = (
+            pl.col("desc")
+            .fill_null("")
+            .str.replace_all(r"[\r\n]+", " ")
+            .str.strip_chars()
+        )
+        return pl.concat_str(
+            pl.col("date").dt.strftime("%Y-%m-%d"),
+            pl.lit(" "),
+            description,
+            pl.lit("\n    ; transaction_id:"),
+            pl.col("transaction_id").cast(pl.String),
+            pl.lit("\n    "),
+            pl.col("account1"),
+            pl.lit("  ")
+            + pl.col("amount").round(2).cast(pl.String)
+            + pl.lit(f" {self.currency}"),
+            pl.lit("\n    ") + pl.col("account2"),
+            pl.lit("\n\n"),
+            # a missing field, e.g. the amount, is left out instead of the entry
+            ignore_nulls=True,
+        )
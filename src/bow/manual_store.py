@@ -0,0 +1,138 @@
+from contextlib import contextmanager
+from pathlib import Path
+import sqlite3
+from typing import Iterator
+import polars as pl
+from parser import bank_transaction_columns_categorized, bank_transaction_data_schema
+
+manual_columns = bank_transaction_columns_categorized + ["transaction_id"]
+
+
+class ManualStore:
+    """
+    SQLite database of the manually categorized transactions, indexed by transaction_id.
+
+    SQLite has no unsigned 64 bit integers, so ids are stored reinterpreted as signed ones.
+    The version of transaction_id they were computed with is stored in the table meta.
+    """
+
+    def __init__(self, db_file: Path):
+        self.db_file = db_file
+        db_file.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS manual_categories (
+                    transaction_id INTEGER PRIMARY KEY,
+                    date TEXT,
+                    account TEXT,
+                    partner TEXT,
+                    desc TEXT,
+                    classification TEXT,
+                    partner_iban TEXT,
+                    amount REAL,
+                    account1 TEXT,
+                    account2 TEXT NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """
+        Commits if no exception occurs, and closes the connection in any case.
+        """
+        connection = sqlite3.connect(self.db_file)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def read(self) -> pl.DataFrame:
+        with self._connect() as connection:
+            rows = connection.execute(
+                f"SELECT {', '.join(manual_columns)} FROM manual_categories"
+            ).fetchall()
+
+        return pl.DataFrame(
+            rows,
+            schema={
+                **{col: bank_transaction_data_schema[col] for col in manual_columns},
+                "date": pl.String,
+                "transaction_id": pl.Int64,
+            },
+            orient="row",
+        ).with_columns(
+            pl.col("date").str.to_date(),
+            pl.col("transaction_id").reinterpret(signed=False),
+        )
+
+    def id_version(self) -> str | None:
+        """
+        Version of transaction_id the stored ids were computed with
+        (see TRANSACTION_ID_VERSION), None for stores older than versions.
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT value FROM meta WHERE key = 'id_version'"
+            ).fetchone()
+        return row[0] if row else None
+
+    def upsert(self, manual: pl.DataFrame) -> int:
+        """
+        Inserts new transactions and updates those with another category than stored.
+        Returns the number of inserted or updated transactions.
+        """
+        with self._connect() as connection:
+            return self._upsert(connection, manual)
+
+    def replace(self, manual: pl.DataFrame, id_version: str) -> int:
+        """
+        Replaces all stored transactions at once, e.g. by the same ones with ids of another version.
+        Returns the number of stored transactions.
+        """
+        with self._connect() as connection:
+            connection.execute("DELETE FROM manual_categories")
+            connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('id_version', ?)",
+                (id_version,),
+            )
+            return self._upsert(connection, manual)
+
+    def _upsert(self, connection: sqlite3.Connection, manual: pl.DataFrame) -> int:
+        rows = manual.select(manual_columns).with_columns(
+            pl.col("date").dt.strftime("%Y-%m-%d"),
+            pl.col("transaction_id").reinterpret(signed=True),
+        )
+        changes_before = connection.total_changes
+        connection.executemany(
+            f"""
+            INSERT INTO manual_categories ({', '.join(manual_columns)})
+            VALUES ({', '.join('?' for _ in manual_columns)})
+            ON CONFLICT (transaction_id) DO UPDATE SET account2 = excluded.account2
+            WHERE account2 != excluded.account2
+            """,
+            rows.iter_rows(),
+        )
+        return connection.total_changes - changes_before
+
+    def delete(self, transaction_ids: pl.Series) -> int:
+        """
+        Returns the number of deleted transactions.
+        """
+        with self._connect() as connection:
+            changes_before = connection.total_changes
+            connection.executemany(
+                "DELETE FROM manual_categories WHERE transaction_id = ?",
+                ((id,) for id in transaction_ids.reinterpret(signed=True)),
+            )
+            return connection.total_changes - changes_before
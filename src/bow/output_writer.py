@@ -0,0 +1,93 @@
+from pathlib import Path
+import shutil
+from urllib.parse import quote
+import polars as pl
+from hledger_writer import HledgerWriter
+
+OUTPUT_FORMATS = ["csv", "parquet", "ipc", "hledger"]
+
+
+class OutputWriter:
+    """
+    Writes the categorized transactions to target_dir in the given formats:
+
+    - csv: a single output.csv, e.g. for hledger
+    - parquet: hive-partitioned folder parquet/year=<year>/account=<account>/transactions.parquet with statistics
+    - ipc: the same partitioning in folder ipc, uncompressed, such that the files can be memory-mapped
+    - hledger: journal files per year in folder hledger, see HledgerWriter
+
+    The partitioned folders can be read with e.g. pl.scan_parquet(target_dir / "parquet", hive_partitioning=True),
+    which skips all partitions not matching a filter on year or account.
+    """
+
+    def __init__(
+        self,
+        target_dir: Path,
+        formats: list[str] = ["csv"],
+        hledger_currency: str = "€",
+    ):
+        unknown = set(formats) - set(OUTPUT_FORMATS)
+        if unknown:
+            raise ValueError(
+                f"Unknown output formats {sorted(unknown)}, choose from {OUTPUT_FORMATS}"
+            )
+        self.target_dir = target_dir
+        self.formats = formats
+        self.hledger_currency = hledger_currency
+
+    def write(self, transactions: pl.DataFrame):
+        if "csv" in self.formats:
+            transactions.write_csv(self.target_dir / "output.csv")
+        if "parquet" in self.formats:
+            self._write_partitioned(
+                transactions,
+                "parquet",
+                lambda df, file: df.write_parquet(file, statistics=True),
+            )
+        if "ipc" in self.formats:
+            self._write_partitioned(
+                transactions,
+                "arrow",
+                lambda df, file: df.write_ipc(file, compression="uncompressed"),
+                folder_name="ipc",
+            )
+        if "hledger" in self.formats:
+            HledgerWriter(self.target_dir / "hledger", self.hledger_currency).write(
+                transactions
+            )
+
+    def _write_partitioned(
+        self,
+        transactions: pl.DataFrame,
+        suffix: str,
+        write_file,
+        folder_name: str | None = None,
+    ):
+        folder = self.target_dir / (folder_name or suffix)
+        # written next to the old output and swapped afterwards, such that readers never see a partial one
+        temp_folder = folder.with_name(folder.name + ".tmp")
+        old_folder = folder.with_name(folder.name + ".old")
+        shutil.rmtree(temp_folder, ignore_errors=True)
+        if old_folder.exists() and not folder.exists():
+            # a previous run stopped in the middle of swapping
+            old_folder.rename(folder)
+        shutil.rmtree(old_folder, ignore_errors=True)
+
+        partitions = transactions.with_columns(
+            year=pl.col("date").dt.year()
+        ).partition_by("year", "account", as_dict=True, include_key=False)
+        for (year, account), partition in partitions.items():
+            partition_folder = (
+                temp_folder / f"year={year}" / f"account={quote(account, safe=' ')}"
+            )
+            partition_folder.mkdir(parents=True)
+            write_file(
+                partition.sort("date"), partition_folder / f"transactions.{suffix}"
+            )
+
+        # two renames instead of an atomic swap, but the old output is kept until the new one is in place
+        temp_folder.mkdir(parents=True, exist_ok=True)
+        if folder.exists():
+            folder.rename(old_folder)
+        temp_folder.rename(folder)
+        shutil.rmtree(old_folder, ignore_errors=True)
@@ -1,9 +1,15 @@
-from typing import defaultdict
+from concurrent.futures import Executor
+from contextlib import contextmanager
+import hashlib
+import tempfile
+from typing import Iterator
 import polars as pl
-from datetime import datetime
 from pathlib import Path
 
 import yaml
+import file_cache
+from file_cache import POLARS_HASH_VERSION
+from profiling import trace
 
 bank_transaction_columns = [
     "date",
@@ -30,70 +36,240 @@ bank_transaction_data_schema = {
     "amount": pl.Float64,
     "account1": pl.String,
     "account2": pl.String,
+    "transaction_id": pl.UInt64,
 }
 
+# increased when parsing changes, such that cached parse results are not used anymore
+CACHE_VERSION = "4"
+# increased when transaction_id changes. The ids use the hash of polars, so they
+# change with its version as well. Stored ids are matched again on their columns
+# whenever this differs.
+TRANSACTION_ID_VERSION = f"2, polars {POLARS_HASH_VERSION}"
+
+
+def transaction_id(columns: list[str]) -> pl.Expr:
+    """
+    Hash of the given columns, made unique among identical rows by hashing in their occurrence count.
+    """
+    content = pl.struct(*columns).hash()
+    # ordinal ranks of equal values follow their order, so this counts the earlier rows with
+    # the same hash, much faster than a window over the columns. Rows of colliding hashes
+    # are counted together, their ids still differ.
+    occurrence = (content.rank("ordinal") - content.rank("min")).cast(pl.UInt32)
+    return (
+        pl.struct(content.alias("content"), occurrence.alias("occurrence"))
+        .hash()
+        .alias("transaction_id")
+    )
+
+
+UTF8_ENCODINGS = {"utf8", "utf-8", "utf8-lossy"}
+
+
+@contextmanager
+def transcoded_to_utf8(
+    file: Path, encoding: str, chunk_chars: int = 2**20
+) -> Iterator[Path]:
+    """
+    Yields a utf-8 version of the file, written chunk by chunk to a temporary file if it has another
+    encoding. Unlike polars.read_csv, which decodes such files as a whole in memory, memory stays flat.
+    """
+    if encoding.lower() in UTF8_ENCODINGS:
+        yield file
+        return
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        utf8_file = Path(temp_dir) / file.name
+        with (
+            open(file, encoding=encoding, newline="") as source,
+            open(utf8_file, "w", encoding="utf-8", newline="") as target,
+        ):
+            while chunk := source.read(chunk_chars):
+                target.write(chunk)
+        yield utf8_file
+
+
+def read_csv_in_batches(
+    file: Path, batch_bytes: int, **read_csv_args
+) -> Iterator[pl.DataFrame]:
+    """
+    Reads a utf-8 csv in batches of about batch_bytes of raw lines, such that only one batch is in memory
+    at a time. Batches always end at a line break outside of quotes. Later batches take the dtypes
+    inferred for the first one, so that all batches fit together.
+
+    The arguments counting rows (skip_rows, skip_rows_after_header, n_rows and row_index_offset)
+    apply to the file as a whole, like for polars.read_csv.
+    """
+    read_csv_args = dict(read_csv_args)
+    skip_rows = read_csv_args.pop("skip_rows", 0)
+    skip_rows_after_header = read_csv_args.pop("skip_rows_after_header", 0)
+    n_rows = read_csv_args.pop("n_rows", None)
+    row_index_name = read_csv_args.pop("row_index_name", None)
+    row_index_offset = read_csv_args.pop("row_index_offset", 0)
+    quote_char = (read_csv_args.get("quote_char", '"') or "").encode("utf-8")
+    has_header = read_csv_args.get("has_header", True)
+
+    def read_lines(f, size: int) -> bytes:
+        lines = f.read(size) + f.readline()
+        while quote_char and lines.count(quote_char) % 2 == 1:
+            line = f.readline()
+            if not line:
+                break
+            lines += line
+        return lines
+
+    def with_row_index(batch: pl.DataFrame, rows_before: int) -> pl.DataFrame:
+        if row_index_name is not None:
+            batch = batch.with_row_index(row_index_name, row_index_offset + rows_before)
+        return batch
+
+    with open(file, "rb") as f:
+        for _ in range(skip_rows):
+            read_lines(f, 0)
+        header = read_lines(f, 0) if has_header else b""
+        for _ in range(skip_rows_after_header):
+            read_lines(f, 0)
+
+        first = True
+        rows = 0
+        while (n_rows is None or rows < n_rows) and (
+            lines := read_lines(f, batch_bytes)
+        ):
+            batch = pl.read_csv(header + lines, **read_csv_args)
+            if n_rows is not None:
+                batch = batch.head(n_rows - rows)
+            if first:
+                read_csv_args["schema_overrides"] = {
+                    col: dtype
+                    for col, dtype in batch.schema.items()
+                    if dtype != pl.Null
+                } | (read_csv_args.get("schema_overrides") or {})
+                first = False
+            yield with_row_index(batch, rows)
+            rows += len(batch)
+
+        if first:
+            yield with_row_index(pl.read_csv(header, **read_csv_args), 0)
+
 
 class Parser:
     def __init__(
         self,
         folder: Path,
         expected_out_columns=bank_transaction_columns,
+        executor: Executor | None = None,
+        cache_dir: Path | None = None,
     ):
+        """
+        If an executor is given, the files of the folder are parsed concurrently within it.
+        If a cache_dir is given, parsed files are stored there and loaded instead of parsed again
+        as long as neither their content nor the parser's cache_key changes.
+        """
         self.folder = folder
         self.expected_out_columns = expected_out_columns
+        self.executor = executor
+        self.cache_dir = cache_dir
 
     def parse(self) -> pl.DataFrame | None:
-        files = list(self.folder.glob("*.csv"))
+        """
+        Parses all files of the folder. Overlapping files are deduplicated as multisets:
+        a transaction occurring n times in one file and m times in another is kept max(n, m) times.
+        """
+        # parse_files keeps the order of files, so the deduplication below is deterministic
+        df = pl.concat(self.parse_files().values())
+
+        with trace.span("deduplicate", rows_in=len(df)) as span:
+            df = df.unique("transaction_id", keep="first", maintain_order=True)
+            span["rows_out"] = len(df)
+        return df
+
+    def parse_files(self) -> dict[str, pl.DataFrame]:
+        """
+        Parses every file of the folder on its own, returned by file name in the order of the names.
+        """
+        files = sorted(self.folder.glob("*.csv"))
         if len(files) == 0:
             raise FileNotFoundError(f"No files found in {self.folder}")
 
-        account_to_timeranges_already_parsed: defaultdict[
-            str, list[(datetime, datetime)]
-        ] = defaultdict(list)
-
-        dfs = []
-        for file in files:
-            print(f"    Parsing {file.relative_to(self.folder.parent.parent)}..")
-            df = self.parse_single_file(file)
-            assert df.columns == self.expected_out_columns
-            for account, timeranges in account_to_timeranges_already_parsed.items():
-                for start, end in timeranges:
-                    df = df.filter(
-                        (pl.col("account") != account)
-                        | (pl.col("date") < start)
-                        | (pl.col("date") > end)
-                    )
-            timeframe_parsed = df.group_by("account").agg(
-                min_time=pl.min("date"), max_time=pl.max("date")
-            )
-            for row in timeframe_parsed.iter_rows(named=True):
-                account = row["account"]
-                min_time = row["min_time"]
-                max_time = row["max_time"]
-                account_to_timeranges_already_parsed[account].append(
-                    (min_time, max_time)
-                )
-
-            dfs.append(df)
-
-        df = pl.concat(dfs)
-
+        map_files = self.executor.map if self.executor else map
+        # the files may be parsed in other threads, which do not know the current span
+        folder_span = trace.current()
+        results = list(map_files(self._parse_file, files, [folder_span] * len(files)))
+        # e.g. of files that changed or no longer exist, or of another parser config
+        file_cache.remove_unused(
+            self.cache_dir, [cache_file for _, cache_file in results], "*.parquet"
+        )
+        return {file.name: df for file, (df, _) in zip(files, results)}
+
+    def _parse_file(
+        self, file: Path, parent_span: dict | None = None
+    ) -> tuple[pl.DataFrame, Path | None]:
+        """
+        Returns the parsed file and its cache file. The file is hashed for its cache file here as
+        well, such that parallel parsers also read the files in parallel.
+        """
+        name = file.relative_to(self.folder.parent.parent)
+        with trace.span(str(name), parent_span) as span:
+            cache_file = self._cache_file(file)
+            cached = cache_file is not None and cache_file.exists()
+            span["cached"] = cached
+            # a single write, such that lines of parallel parsers don't interleave
+            if cached:
+                print(f"    Loading {name} from cache..\n", end="")
+                df = pl.read_parquet(cache_file)
+            else:
+                print(f"    Parsing {name}..\n", end="")
+                df = self.parse_single_file(file)
+                assert df.columns == self.expected_out_columns
+                df = self._with_transaction_ids(df)
+                if cache_file is not None:
+                    with file_cache.writing(cache_file) as temp_file:
+                        df.write_parquet(temp_file)
+            span["rows_out"] = len(df)
+        return df, cache_file
+
+    def _with_transaction_ids(self, df: pl.DataFrame) -> pl.DataFrame:
+        """
+        Identical transactions are counted within the file, so the ids of a file do not depend on the
+        others and are cached along with it.
+        """
         if "partner_iban" in df.columns:
             df = df.with_columns(
                 partner_iban=pl.when(pl.col("partner_iban").is_not_null())
                 .then(pl.col("partner_iban").cast(pl.String).str.replace_all(" ", ""))
                 .otherwise(pl.col("partner_iban"))
             )
-        df = df.select(self.expected_out_columns)
-        return df
+        return df.with_columns(transaction_id(self.expected_out_columns))
+
+    def _cache_file(self, file: Path) -> Path | None:
+        if self.cache_dir is None:
+            return None
+
+        return file_cache.cache_file(
+            self.cache_dir,
+            file,
+            [self.cache_key(), pl.__version__, CACHE_VERSION],
+            ".parquet",
+        )
+
+    def cache_key(self) -> str:
+        """
+        Everything besides the content and name of a file that determines how it is parsed.
+        """
+        return ""
 
     def parse_single_file(self, file: Path) -> pl.DataFrame:
         raise NotImplementedError()
 
 
 class ConfigFileBasedParser(Parser):
-    def __init__(self, folder: Path):
-        super().__init__(folder)
+    def __init__(
+        self,
+        folder: Path,
+        executor: Executor | None = None,
+        cache_dir: Path | None = None,
+    ):
+        super().__init__(folder, executor=executor, cache_dir=cache_dir)
 
         self.parse_config_file = folder / "parser_config.yml"
         if not self.parse_config_file.exists():
@@ -105,9 +281,46 @@ class ConfigFileBasedParser(Parser):
         if "expected_out_columns" in self.config:
             self.expected_out_columns = self.config["expected_out_columns"]
 
+    def cache_key(self) -> str:
+        return hashlib.sha256(self.parse_config_file.read_bytes()).hexdigest()
+
     def parse_single_file(self, file: Path) -> pl.DataFrame:
+        if "streaming" in self.config:
+            return self.parse_single_file_streaming(
+                file, self.config["streaming"] or {}
+            )
+
         df = pl.read_csv(file, **self.config.get("read_csv", {}))
+        return self.transform(df, file)
+
+    def parse_single_file_streaming(
+        self, file: Path, settings: dict[str, float]
+    ) -> pl.DataFrame:
+        """
+        Reads and transforms the file in batches of rows, such that only one batch of the raw csv is
+        in memory at a time. This works since all steps of transform are row-wise.
+        """
+        read_csv_args = dict(self.config.get("read_csv", {}))
+        encoding = read_csv_args.pop("encoding", "utf8")
+        if encoding.lower() == "utf8-lossy":
+            # the file is not transcoded, so every batch replaces invalid bytes on its own
+            read_csv_args["encoding"] = encoding
+
+        # a parsed and transformed batch takes about three times the memory of its raw lines
+        batch_bytes = int(settings.get("memory_limit_mb", 256) * 2**20 / 3)
+
+        with transcoded_to_utf8(file, encoding) as utf8_file:
+            parts = [
+                self.transform(batch, file)
+                for batch in read_csv_in_batches(
+                    utf8_file, batch_bytes, **read_csv_args
+                )
+            ]
+
+        # e.g. an all-null column in one batch is not typed like in the others
+        return pl.concat(parts, how="vertical_relaxed", rechunk=False)
 
+    def transform(self, df: pl.DataFrame, file: Path) -> pl.DataFrame:
         if self.config.get("pre_rename", {}).get("lower_columns", False):
             df = df.rename({col: col.lower() for col in df.columns})
         if self.config.get("pre_rename", {}).get("strip_spaces", False):
@@ -181,7 +394,9 @@ class ConfigFileBasedParser(Parser):
 
         for col in self.expected_out_columns:
             if col not in df.columns:
-                df = df.with_columns(pl.lit(None).alias(col))
+                df = df.with_columns(
+                    pl.lit(None, dtype=bank_transaction_data_schema.get(col)).alias(col)
+                )
 
         if row_filter := self.config.get("row_filter", None):
             if "date_begin" in row_filter:
@@ -200,19 +415,19 @@ class FinanzmanagerParser(Parser):
         super().__init__(folder=folder)
 
     def parse_single_file_raw(self, file: Path) -> pl.DataFrame:
-        buchungen_finanzmanager_raw = pl.read_csv(
-            file,
-            separator=";",
-            decimal_comma=True,
-            schema_overrides={
-                "Haben": pl.String,
-                "Soll": pl.String,
-                "Beleg": pl.String,
-            },
-            try_parse_dates=True,
-            null_values=[""],
-            encoding="UTF-16",
-        )
+        with transcoded_to_utf8(file, "UTF-16") as utf8_file:
+            buchungen_finanzmanager_raw = pl.read_csv(
+                utf8_file,
+                separator=";",
+                decimal_comma=True,
+                schema_overrides={
+                    "Haben": pl.String,
+                    "Soll": pl.String,
+                    "Beleg": pl.String,
+                },
+                try_parse_dates=True,
+                null_values=[""],
+            )
         return buchungen_finanzmanager_raw
 
     def parse_single_file(self, file: Path) -> pl.DataFrame:
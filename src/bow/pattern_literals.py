@@ -0,0 +1,74 @@
+import re
+import re._parser as sre_parse
+import warnings
+
+MIN_LITERAL_LENGTH = 3
+
+
+def required_literals(pattern: str) -> list[str] | None:
+    """
+    Returns lowercase ascii literals of which at least one is contained in every string the pattern
+    finds a match in (in the sense of polars str.contains), or None if no such literals could be found.
+
+    Example: ".*kartenpreis.*|.*depotgeb.*" -> ["depotgeb", "kartenpreis"]
+
+    Since the literals are meant to be searched ascii-case-insensitively, only ascii characters are
+    taken into account. Literals shorter than MIN_LITERAL_LENGTH are not worth a prefilter and are discarded.
+    """
+    try:
+        with warnings.catch_warnings():
+            # e.g. posix classes like [[:alpha:]], which python parses differently than polars
+            warnings.simplefilter("error")
+            parsed = sre_parse.parse(pattern)
+    except (re.error, RecursionError, FutureWarning, TypeError):
+        return None
+
+    literals = _required_literals(list(parsed))
+    if (
+        literals is None
+        or min(len(literal) for literal in literals) < MIN_LITERAL_LENGTH
+    ):
+        return None
+    return sorted(literals)
+
+
+def _required_literals(items: list) -> set[str] | None:
+    best = None
+
+    def consider(candidate: set[str] | None):
+        nonlocal best
+        if candidate and (best is None or _score(candidate) > _score(best)):
+            best = candidate
+
+    run = []
+    for op, av in items:
+        if op is sre_parse.LITERAL and av < 128:
+            run.append(chr(av).lower())
+            continue
+
+        consider({"".join(run)} if run else None)
+        run = []
+
+        if op is sre_parse.SUBPATTERN:
+            consider(_required_literals(list(av[-1])))
+        elif op is sre_parse.ATOMIC_GROUP:
+            consider(_required_literals(list(av)))
+        elif op in (
+            sre_parse.MAX_REPEAT,
+            sre_parse.MIN_REPEAT,
+            sre_parse.POSSESSIVE_REPEAT,
+        ):
+            min_repetitions, _, sub_pattern = av
+            if min_repetitions >= 1:
+                consider(_required_literals(list(sub_pattern)))
+        elif op is sre_parse.BRANCH:
+            alternatives = [_required_literals(list(branch)) for branch in av[1]]
+            if all(alternatives):
+                consider(set().union(*alternatives))
+
+    consider({"".join(run)} if run else None)
+    return best
+
+
+def _score(literals: set[str]) -> tuple[int, int]:
+    return min(len(literal) for literal in literals), -len(literals)
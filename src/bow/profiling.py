@@ -0,0 +1,183 @@
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import os
+from pathlib import Path
+import sys
+from threading import Event, Lock, Thread, current_thread, local
+import time
+from typing import Iterator
+import polars as pl
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss() -> int | None:
+    """
+    Resident memory of this process in bytes, None if unknown on this platform.
+    """
+    try:
+        with open("/proc/self/statm", encoding="ascii") as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return None
+
+
+def peak_rss() -> int | None:
+    """
+    Highest resident memory of this process so far in bytes, None if unknown on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Measurement:
+    """
+    Measures the wall time, the cpu time of the process and the peak resident memory of a block:
+
+        with Measurement() as measurement:
+            ...
+        print(measurement.seconds, measurement.cpu_seconds, measurement.peak_rss)
+
+    The memory of polars is allocated outside of python, so it is sampled every interval seconds
+    by a thread instead of traced. Where the current memory is unknown, peak_rss is the peak of the
+    whole process so far.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.seconds: float | None = None
+        self.cpu_seconds: float | None = None
+        self.start_rss: int | None = None
+        self.peak_rss: int | None = None
+        self._stop = Event()
+        self._thread = Thread(target=self._sample, daemon=True)
+
+    def __enter__(self) -> "Measurement":
+        self.start_rss = current_rss()
+        self.peak_rss = self.start_rss
+        if self.start_rss is not None:
+            self._thread.start()
+        self._start = time.perf_counter()
+        self._start_cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self._start
+        self.cpu_seconds = time.process_time() - self._start_cpu
+        if self.start_rss is None:
+            self.peak_rss = peak_rss()
+            return
+        self._stop.set()
+        self._thread.join()
+        self._update_peak()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._update_peak()
+
+    def _update_peak(self):
+        rss = current_rss()
+        if rss is not None and rss > self.peak_rss:
+            self.peak_rss = rss
+
+
+class Trace:
+    """
+    Spans of a run, e.g. its stages and their steps, with wall time, cpu time, peak memory and
+    attributes like row counts, written as json. Disabled spans cost nearly nothing.
+
+    Spans nest within a thread; spans in worker threads get their parent passed explicitly.
+    Cpu time and memory are those of the whole process, so concurrent spans (e.g. files parsed in
+    parallel) overlap in them.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans: list[dict] = []
+        self._lock = Lock()
+        self._local = local()
+
+    def enable(self):
+        self.enabled = True
+        self.spans = []
+        self.started = datetime.now()
+        self._start = time.perf_counter()
+
+    def current(self) -> dict | None:
+        stack = getattr(self._local, "stack", [])
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(
+        self, name: str, parent: dict | None = None, **attributes
+    ) -> Iterator[dict]:
+        """
+        Yields the span, such that attributes known only at its end (e.g. rows_out) can be set.
+        """
+        if not self.enabled:
+            yield {}
+            return
+
+        parent = parent or self.current()
+        with self._lock:
+            span = {
+                "id": len(self.spans),
+                "parent": parent["id"] if parent else None,
+                "name": name,
+                "thread": current_thread().name,
+                **attributes,
+            }
+            self.spans.append(span)
+
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        self._local.stack.append(span)
+        start = time.perf_counter() - self._start
+        try:
+            with Measurement() as measurement:
+                yield span
+        finally:
+            self._local.stack.pop()
+            span.update(
+                start_seconds=round(start, 6),
+                wall_seconds=round(measurement.seconds, 6),
+                cpu_seconds=round(measurement.cpu_seconds, 6),
+                peak_rss_mb=(
+                    None
+                    if measurement.peak_rss is None
+                    else round(measurement.peak_rss / 2**20, 1)
+                ),
+            )
+
+    def write(self, file: Path):
+        with open(file, "w", encoding="utf-8") as stream:
+            json.dump(
+                {
+                    "started": self.started.isoformat(timespec="seconds"),
+                    "polars_version": pl.__version__,
+                    "spans": self.spans,
+                },
+                stream,
+                indent=2,
+                default=str,
+            )
+
+
+# the trace of this process, enabled by --profile
+trace = Trace()
+
+
+def rows(frame: pl.DataFrame | pl.LazyFrame | None) -> int | None:
+    """
+    Number of rows, None for lazy frames, which are not computed yet.
+    """
+    return len(frame) if isinstance(frame, pl.DataFrame) else None
@@ -1,7 +1,43 @@
+import hashlib
 import re
 from dataclasses import dataclass
 from datetime import datetime
 import polars as pl
+from pattern_literals import required_literals
+
+# amount regexes with an equivalent numeric predicate, see Rule.__init__
+NEGATIVE_AMOUNT_PATTERNS = {"^[-].*", "^-.*", "^[-]", "^-", r"^\-.*", r"^\-"}
+NON_NEGATIVE_AMOUNT_PATTERNS = {"^[^-].*", "^[^-]"}
+AMOUNT_SIGNS = {"negative", "positive"}
+
+
+class LazyPattern:
+    """
+    Regex like re.Pattern, but compiled on its first match: rules are applied by polars with its own
+    regex engine, only the legacy matching needs the one of python.
+    """
+
+    def __init__(self, pattern: str, flags: int = re.NOFLAG):
+        self.pattern = pattern
+        self.flags = flags
+        self._compiled: re.Pattern | None = None
+
+    def match(self, string: str) -> re.Match | None:
+        if self._compiled is None:
+            self._compiled = re.compile(self.pattern, self.flags)
+        return self._compiled.match(string)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, LazyPattern) and (self.pattern, self.flags) == (
+            other.pattern,
+            other.flags,
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.pattern, self.flags))
+
+    def __repr__(self) -> str:
+        return f"LazyPattern({self.pattern!r})"
 
 
 @dataclass
@@ -13,6 +49,10 @@ class Rule:
 
     The category_pattern refers to the category field of the transaction.
 
+    The amount can be restricted numerically by amount_min, amount_max (both inclusive),
+    amount_sign ("negative" or "positive") and amount_exact (+- amount_tolerance).
+    Common amount regexes like "^[-].*" are rewritten to these predicates.
+
     base_pattern is applied to every string field of the transaction (account, partner, partner_iban, desc, category), and connected with OR (so one match is enough).
     """
 
@@ -23,13 +63,18 @@ class Rule:
     date: datetime | None = None
     date_start = datetime.min.date()
     date_end = datetime.max.date()
-    amount: re.Pattern = re.compile(r".*", flags=re.IGNORECASE)
-    base: re.Pattern = re.compile(r".*", flags=re.IGNORECASE)
-    account: re.Pattern = re.compile(r".*", flags=re.IGNORECASE)
-    desc: re.Pattern = re.compile(r".*", flags=re.IGNORECASE)
-    partner: re.Pattern = re.compile(r".*", flags=re.IGNORECASE)
-    partner_iban: re.Pattern = re.compile(r".*", flags=re.IGNORECASE)
-    classification: re.Pattern = re.compile(r".*", flags=re.IGNORECASE)
+    amount: LazyPattern = LazyPattern(r".*", flags=re.IGNORECASE)
+    amount_min: float | None = None
+    amount_max: float | None = None
+    amount_sign: str | None = None
+    amount_exact: float | None = None
+    amount_tolerance: float = 0.005
+    base: LazyPattern = LazyPattern(r".*", flags=re.IGNORECASE)
+    account: LazyPattern = LazyPattern(r".*", flags=re.IGNORECASE)
+    desc: LazyPattern = LazyPattern(r".*", flags=re.IGNORECASE)
+    partner: LazyPattern = LazyPattern(r".*", flags=re.IGNORECASE)
+    partner_iban: LazyPattern = LazyPattern(r".*", flags=re.IGNORECASE)
+    classification: LazyPattern = LazyPattern(r".*", flags=re.IGNORECASE)
 
     def __init__(
         self,
@@ -40,6 +85,11 @@ class Rule:
         date_end: datetime = datetime.max.date(),
         case_sensitive: bool = False,
         amount: str = ".*",
+        amount_min: float | None = None,
+        amount_max: float | None = None,
+        amount_sign: str | None = None,
+        amount_exact: float | None = None,
+        amount_tolerance: float = 0.005,
         base: str = ".*",
         account: str = ".*",
         desc: str = ".*",
@@ -49,23 +99,93 @@ class Rule:
     ):
         flags = re.NOFLAG if case_sensitive else re.IGNORECASE
 
+        if amount_sign is not None and amount_sign not in AMOUNT_SIGNS:
+            raise ValueError(
+                f"amount_sign must be one of {sorted(AMOUNT_SIGNS)}, not {amount_sign}"
+            )
+        if amount in NEGATIVE_AMOUNT_PATTERNS and amount_sign is None:
+            amount, amount_sign = ".*", "negative"
+        elif amount in NON_NEGATIVE_AMOUNT_PATTERNS:
+            amount, amount_min = ".*", max(0.0, amount_min or 0.0)
+
         self.category = category
         self.name = name
         self.date = date
         self.date_start = date_start
         self.date_end = date_end
         self.case_sensitive = case_sensitive
-        self.amount = re.compile(amount, flags=flags)
-        self.base = re.compile(base, flags=flags)
-        self.account = re.compile(account, flags=flags)
-        self.desc = re.compile(desc, flags=flags)
-        self.partner = re.compile(partner, flags=flags)
-        self.partner_iban = re.compile(partner_iban, flags=flags)
-        self.classification = re.compile(classification, flags=flags)
+        self.amount = LazyPattern(amount, flags=flags)
+        self.amount_min = None if amount_min is None else float(amount_min)
+        self.amount_max = None if amount_max is None else float(amount_max)
+        self.amount_sign = amount_sign
+        self.amount_exact = None if amount_exact is None else float(amount_exact)
+        self.amount_tolerance = float(amount_tolerance)
+        self.base = LazyPattern(base, flags=flags)
+        self.account = LazyPattern(account, flags=flags)
+        self.desc = LazyPattern(desc, flags=flags)
+        self.partner = LazyPattern(partner, flags=flags)
+        self.partner_iban = LazyPattern(partner_iban, flags=flags)
+        self.classification = LazyPattern(classification, flags=flags)
+
+        # built on first use, see expression, literal_conditions and fingerprint
+        self._expression: pl.Expr | None = None
+        self._literal_conditions: list[tuple[list[str], list[str]]] | None = None
+        self._fingerprint: str | None = None
 
     def __str__(self):
         return self.name if self.name else self.category
 
+    def validate(self):
+        """
+        Raises a ValueError if a pattern is invalid for the regex engine of polars, which applies them.
+        """
+        case_insensitive_flag = "(?i)" if not self.case_sensitive else ""
+        patterns = {"base": self.base, "amount": self.amount, **self.string_patterns()}
+        for field, matcher in patterns.items():
+            if not isinstance(matcher.pattern, str):
+                raise ValueError(
+                    f"Invalid {field} pattern {matcher.pattern!r} of rule {self}: "
+                    f"patterns must be strings, quote it"
+                )
+            if matcher.pattern == ".*":
+                continue
+            try:
+                pl.select(
+                    pl.lit("").str.contains(f"{case_insensitive_flag}{matcher.pattern}")
+                )
+            except pl.exceptions.ComputeError as e:
+                raise ValueError(
+                    f"Invalid {field} pattern {matcher.pattern!r} of rule {self}: {e}"
+                ) from e
+        if not isinstance(self.category, str) or not self.category:
+            raise ValueError(f"Rule {self} needs a category")
+
+    def fingerprint(self) -> str:
+        """
+        Hash of everything influencing which rows this rule matches and which category it gives them.
+        """
+        if self._fingerprint is None:
+            self._fingerprint = self._build_fingerprint()
+        return self._fingerprint
+
+    def _build_fingerprint(self) -> str:
+        content = (
+            self.category,
+            self.date,
+            self.date_start,
+            self.date_end,
+            self.case_sensitive,
+            self.amount.pattern,
+            self.amount_min,
+            self.amount_max,
+            self.amount_sign,
+            self.amount_exact,
+            self.amount_tolerance if self.amount_exact is not None else None,
+            self.base.pattern,
+            *(matcher.pattern for matcher in self.string_patterns().values()),
+        )
+        return hashlib.sha256(repr(content).encode("utf-8")).hexdigest()[:16]
+
     def matches(
         self,
         date: datetime,
@@ -84,7 +204,9 @@ class Rule:
                 return False
             if date < self.date_start or date > self.date_end:
                 return False
-            if not self.amount.match(str(amount)):
+            if self.amount.pattern != ".*" and not self.amount.match(str(amount)):
+                return False
+            if not self.matches_amount(amount):
                 return False
 
             patterns = {
@@ -113,9 +235,36 @@ class Rule:
             print(f"Error in rule {self}: {e}")
             return False
 
-    def filter_dataframe(self, df: pl.DataFrame) -> pl.DataFrame:
-        case_insensitive_flag = "(?i)" if not self.case_sensitive else ""
-        patterns = {
+    def matches_amount(self, amount: float) -> bool:
+        """
+        Checks the numeric amount predicates only.
+        """
+        if self.amount_min is not None and amount < self.amount_min:
+            return False
+        if self.amount_max is not None and amount > self.amount_max:
+            return False
+        if self.amount_sign == "negative" and not amount < 0:
+            return False
+        if self.amount_sign == "positive" and not amount > 0:
+            return False
+        if (
+            self.amount_exact is not None
+            and abs(amount - self.amount_exact) > self.amount_tolerance
+        ):
+            return False
+        return True
+
+    def amount_predicates(self) -> dict[str, float | str]:
+        predicates = {
+            "amount_min": self.amount_min,
+            "amount_max": self.amount_max,
+            "amount_sign": self.amount_sign,
+            "amount_exact": self.amount_exact,
+        }
+        return {name: value for name, value in predicates.items() if value is not None}
+
+    def string_patterns(self) -> dict[str, LazyPattern]:
+        return {
             "account": self.account,
             "desc": self.desc,
             "partner": self.partner,
@@ -123,6 +272,56 @@ class Rule:
             "classification": self.classification,
         }
 
+    def pattern_summary(self) -> str:
+        """
+        All patterns restricting this rule, e.g. "partner: .*amazon.*, amount: ^[-].*".
+        """
+        patterns = {"base": self.base, "amount": self.amount, **self.string_patterns()}
+        return ", ".join(
+            [
+                f"{field}: {matcher.pattern}"
+                for field, matcher in patterns.items()
+                if matcher.pattern != ".*"
+            ]
+            + [f"{name}: {value}" for name, value in self.amount_predicates().items()]
+        )
+
+    def literal_conditions(self) -> list[tuple[list[str], list[str]]]:
+        """
+        Necessary conditions of this rule as (columns, literals): a row can only be matched
+        if one of the columns contains one of the literals (ascii case-insensitive).
+        """
+        if self._literal_conditions is None:
+            self._literal_conditions = self._build_literal_conditions()
+        return self._literal_conditions
+
+    def _build_literal_conditions(self) -> list[tuple[list[str], list[str]]]:
+        patterns = self.string_patterns()
+        conditions = []
+        for field, matcher in patterns.items():
+            if matcher.pattern == ".*":
+                continue
+            if literals := required_literals(matcher.pattern):
+                conditions.append(([field], literals))
+
+        if self.base.pattern != ".*":
+            if literals := required_literals(self.base.pattern):
+                conditions.append((list(patterns), literals))
+
+        return conditions
+
+    def expression(self) -> pl.Expr:
+        """
+        Boolean expression that is true for every row matched by this rule.
+        """
+        if self._expression is None:
+            self._expression = self._build_expression()
+        return self._expression
+
+    def _build_expression(self) -> pl.Expr:
+        case_insensitive_flag = "(?i)" if not self.case_sensitive else ""
+        patterns = self.string_patterns()
+
         single_pattern_filter = pl.lit(True)
         for field, matcher in patterns.items():
             if matcher.pattern == ".*":
@@ -142,11 +341,33 @@ class Rule:
 
         pattern_filter = single_pattern_filter & base_pattern_filter
 
-        return df.filter(
-            (pl.col("date") >= self.date_start)
-            & (pl.col("date") <= self.date_end)
-            & pl.col("amount")
+        amount_filter = (
+            pl.lit(True)
+            if self.amount.pattern == ".*"
+            else pl.col("amount")
             .cast(pl.String)
             .str.contains(f"{case_insensitive_flag}{self.amount.pattern}")
-            & pattern_filter
         )
+        if self.amount_min is not None:
+            amount_filter &= pl.col("amount") >= self.amount_min
+        if self.amount_max is not None:
+            amount_filter &= pl.col("amount") <= self.amount_max
+        if self.amount_sign == "negative":
+            amount_filter &= pl.col("amount") < 0
+        if self.amount_sign == "positive":
+            amount_filter &= pl.col("amount") > 0
+        if self.amount_exact is not None:
+            amount_filter &= (
+                pl.col("amount") - self.amount_exact
+            ).abs() <= self.amount_tolerance
+
+        date_filter = pl.lit(True)
+        if self.date_start != datetime.min.date():
+            date_filter &= pl.col("date") >= self.date_start
+        if self.date_end != datetime.max.date():
+            date_filter &= pl.col("date") <= self.date_end
+
+        return date_filter & amount_filter & pattern_filter
+
+    def filter_dataframe(self, df: pl.DataFrame) -> pl.DataFrame:
+        return df.filter(self.expression())
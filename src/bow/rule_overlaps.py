@@ -0,0 +1,192 @@
+import json
+from pathlib import Path
+import numpy as np
+import polars as pl
+from rules_applier import RulesApplier
+
+# number of set bits of every byte, as np.bitwise_count needs numpy 2
+BITS_PER_BYTE = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+
+class RuleOverlaps:
+    """
+    Report about the transactions matched by several rules of a rule set: overlapping rule pairs,
+    rules shadowed by earlier ones and transactions matched by rules of different categories.
+
+    Everything is derived from the match matrix of all rules (see RulesApplier.match_matrix), which is
+    computed in a single pass instead of evaluating the rules one after another.
+    """
+
+    def __init__(
+        self,
+        applier: RulesApplier,
+        transactions: pl.DataFrame,
+        n_examples: int = 20,
+        chunk_rows: int = 1 << 16,
+    ):
+        self.rules = applier.rules
+        self.transactions = transactions
+        self.n_examples = n_examples
+        self.matrix = applier.match_matrix(transactions)
+        self.matched = BITS_PER_BYTE[self.matrix].sum(axis=1, dtype=np.int64)
+        self.first_matched = self._first_matched()
+        self.multi_matches = self._multi_matches(chunk_rows)
+        # see overlaps
+        self._overlaps: pl.DataFrame | None = None
+        self.rule_info = pl.DataFrame(
+            {
+                "rule": range(len(self.rules)),
+                "name": [str(rule) for rule in self.rules],
+                "category": [rule.category for rule in self.rules],
+                "patterns": [rule.pattern_summary() for rule in self.rules],
+                "matched": self.matched,
+                "first_matched": self.first_matched,
+            },
+            schema_overrides={
+                "rule": pl.UInt32,
+                "matched": pl.Int64,
+                "first_matched": pl.Int64,
+            },
+        )
+
+    def _first_matched(self) -> np.ndarray:
+        """
+        Rows every rule matches first, i.e. not matched by any earlier rule.
+        """
+        first_matched = np.zeros(len(self.rules), dtype=np.int64)
+        earlier = np.zeros(self.matrix.shape[1], dtype=np.uint8)
+        for i, bits in enumerate(self.matrix):
+            first_matched[i] = BITS_PER_BYTE[bits & ~earlier].sum(dtype=np.int64)
+            earlier |= bits
+        return first_matched
+
+    def _multi_matches(self, chunk_rows: int) -> pl.DataFrame:
+        """
+        Pairs of rule and row for all rows matched by more than one rule. The matrix is unpacked in
+        chunks of rows, such that its unpacked size stays bounded.
+        """
+        parts = [pl.DataFrame(schema={"rule": pl.UInt32, "row": pl.UInt32})]
+        chunk_bytes = max(1, chunk_rows // 8)
+        for start in range(0, self.matrix.shape[1], chunk_bytes):
+            bits = np.unpackbits(self.matrix[:, start : start + chunk_bytes], axis=1)
+            multi = np.flatnonzero(bits.sum(axis=0, dtype=np.uint32) > 1)
+            rules, columns = np.nonzero(bits[:, multi])
+            parts.append(
+                pl.DataFrame(
+                    {"rule": rules, "row": multi[columns] + start * 8},
+                    schema={"rule": pl.UInt32, "row": pl.UInt32},
+                )
+            )
+        return pl.concat(parts)
+
+    def overlaps(self) -> pl.DataFrame:
+        """
+        Pairs of rules matching at least one common row, with the number of common rows and their
+        share of the rows of the later rule.
+        """
+        if self._overlaps is None:
+            self._overlaps = self._build_overlaps()
+        return self._overlaps
+
+    def _build_overlaps(self) -> pl.DataFrame:
+        info = self.rule_info.select("rule", "name", "category", "matched")
+        return (
+            self.multi_matches.join(self.multi_matches, on="row", suffix="_b")
+            .filter(pl.col("rule") < pl.col("rule_b"))
+            .group_by("rule", "rule_b")
+            .agg(overlap=pl.len())
+            .join(info, on="rule")
+            .join(info.rename(lambda column: f"{column}_b"), on="rule_b")
+            .with_columns(share_of_b=pl.col("overlap") / pl.col("matched_b"))
+            .drop("matched", "matched_b")
+            .sort("overlap", "rule", "rule_b", descending=[True, False, False])
+        )
+
+    def shadowed_rules(self) -> pl.DataFrame:
+        """
+        Rules matching transactions, but all of them already matched by earlier rules, with these
+        earlier rules and those covering all of its rows on their own.
+        """
+        shadowing = (
+            self.overlaps()
+            .join(
+                self.rule_info.select("rule", "matched"),
+                left_on="rule_b",
+                right_on="rule",
+            )
+            .group_by("rule_b")
+            .agg(
+                shadowed_by=pl.col("rule").sort(),
+                fully_covered_by=pl.col("rule")
+                .filter(pl.col("overlap") == pl.col("matched"))
+                .sort(),
+            )
+            .rename({"rule_b": "rule"})
+        )
+        return (
+            self.rule_info.filter(pl.col("matched") > 0, pl.col("first_matched") == 0)
+            .join(shadowing, on="rule", how="left")
+            .drop("first_matched")
+            .sort("rule")
+        )
+
+    def conflicts(self) -> pl.DataFrame:
+        """
+        Transactions matched by rules of different categories, grouped by these categories, with the
+        rules involved and an example transaction.
+        """
+        conflicts = (
+            self.multi_matches.join(
+                self.rule_info.select("rule", "category"), on="rule"
+            )
+            .group_by("row")
+            .agg(
+                categories=pl.col("category").unique().sort(),
+                rules=pl.col("rule").sort(),
+            )
+            .filter(pl.col("categories").list.len() > 1)
+            .group_by("categories")
+            .agg(
+                transactions=pl.len(),
+                rules=pl.col("rules").flatten().unique().sort(),
+                example_row=pl.col("row").min(),
+            )
+            .sort("transactions", descending=True)
+        )
+        examples = self.transactions.with_row_index("example_row").select(
+            "example_row",
+            example=pl.concat_str(
+                [
+                    pl.col(column).cast(pl.String)
+                    for column in ["date", "amount", "partner", "desc"]
+                ],
+                separator=" | ",
+                ignore_nulls=True,
+            ),
+        )
+        return conflicts.join(examples, on="example_row", how="left").drop(
+            "example_row"
+        )
+
+    def write(self, target_dir: Path):
+        overlaps = self.overlaps()
+        shadowed_rules = self.shadowed_rules()
+        conflicts = self.conflicts()
+        overlaps.write_csv(target_dir / "rule_overlaps.csv")
+
+        report = {
+            "rules": len(self.rules),
+            "transactions": len(self.transactions),
+            "multi_matched_transactions": self.multi_matches["row"].n_unique(),
+            "shadowed_rules": shadowed_rules.to_dicts(),
+            "conflicts": conflicts.to_dicts(),
+            "largest_overlaps": overlaps.head(self.n_examples).to_dicts(),
+        }
+        with open(target_dir / "rule_overlaps.json", "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False, default=str)
+
+        print(
+            f"    Wrote rule overlaps to {target_dir}: {len(overlaps)} overlapping pairs, "
+            f"{len(shadowed_rules)} shadowed rules, {conflicts['transactions'].sum()} transactions "
+            f"with conflicting categories"
+        )
@@ -0,0 +1,47 @@
+import json
+from pathlib import Path
+import polars as pl
+
+
+class RuleStatistics:
+    """
+    Report about the profile of a rule set (see RulesApplier.profile).
+    """
+
+    def __init__(self, profile: pl.DataFrame, n_most_expensive: int = 10):
+        self.profile = profile
+        self.n_most_expensive = n_most_expensive
+
+    def dead_rules(self) -> pl.DataFrame:
+        """
+        Rules never matching a transaction first, because they match nothing or only rows of earlier rules.
+        """
+        return self.profile.filter(pl.col("dead"))
+
+    def most_expensive_rules(self) -> pl.DataFrame:
+        return self.profile.sort("seconds", descending=True).head(self.n_most_expensive)
+
+    def write(self, target_dir: Path):
+        self.profile.write_csv(target_dir / "rule_statistics.csv")
+
+        report = {
+            "rules": len(self.profile),
+            "prefilter_seconds": (
+                self.profile["prefilter_seconds"][0] if len(self.profile) else 0.0
+            ),
+            "rules_seconds": self.profile["seconds"].sum(),
+            "dead_rules": self.dead_rules()
+            .select("rule", "name", "patterns", "matched")
+            .to_dicts(),
+            "most_expensive_rules": self.most_expensive_rules()
+            .select("rule", "name", "patterns", "seconds", "candidates", "prefiltered")
+            .to_dicts(),
+            "per_rule": self.profile.drop("prefilter_seconds").to_dicts(),
+        }
+        with open(target_dir / "rule_statistics.json", "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+
+        print(
+            f"    Wrote rule statistics to {target_dir}: {len(self.dead_rules())} dead rules, "
+            f"slowest rule '{self.most_expensive_rules()['name'][0] if len(self.profile) else None}'"
+        )
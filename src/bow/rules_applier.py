@@ -1,10 +1,14 @@
 from rule import Rule
 from collections import defaultdict
+import time
+from typing import TYPE_CHECKING
 import polars as pl
 from parser import bank_transaction_columns
 
+if TYPE_CHECKING:
+    import numpy as np
+
 
-# if this gets too slow, we could try to use filter upon the main dataframe, going through every rule one after the other an building a new dataframe this way
 class RulesApplier:
     def __init__(self, rules: list[Rule]):
         self.rules = rules
@@ -29,41 +33,298 @@ class RulesApplier:
     def apply(self, data: pl.DataFrame) -> pl.DataFrame:
         """
         This is faster than the legacy apply method. Use this.
+
+        Every row gets the category of the first rule matching it, in the order of self.rules.
+        """
+        return self.categorize(data, self.rule_indices(data))
+
+    def categorize(self, data: pl.DataFrame, rule_index: pl.Series) -> pl.DataFrame:
         """
-        data_rest = data.clone()
-        data_rest = data_rest.with_columns(
+        Adds account1 and account2 given the index of the rule matching each row (see rule_indices).
+        """
+        categories = pl.Series([rule.category for rule in self.rules], dtype=pl.String)
+        return data.with_columns(
             account1=pl.lit("account:") + pl.col("account"),
-            account2=pl.when(pl.col("amount") > 0)
-            .then(pl.lit("incomes:unknown"))
-            .otherwise(pl.lit("expenses:unknown")),
+            account2=pl.coalesce(
+                pl.lit(categories.gather(rule_index)),
+                self._default_category(),
+            ),
         )
-        new_data = []
-        for rule in self.rules:
-            filtered = rule.filter_dataframe(data_rest).with_columns(
-                account2=pl.lit(rule.category)
+
+    def rule_indices(self, data: pl.DataFrame) -> pl.Series:
+        """
+        Index into self.rules of the first rule matching each row, or null if no rule matches.
+
+        The literals every rule requires are searched in one multi-pattern scan per column first,
+        such that the regexes of a rule run only on rows containing its literals and not yet matched
+        by an earlier rule. The rules without such literals are evaluated afterwards in a single
+        when/then-chain, on the rows not matched by an earlier rule and only on the columns they use.
+        """
+        candidate_rows = self._candidate_rows(data)
+        rows = data.with_row_index("row")
+        rule_index = pl.Series("rule_index", [None] * len(data), dtype=pl.UInt32)
+        unmatched = pl.Series("unmatched", [True] * len(data), dtype=pl.Boolean)
+
+        for i in sorted(candidate_rows):
+            candidates = candidate_rows[i].filter(unmatched.gather(candidate_rows[i]))
+            matched = rows[candidates].filter(self.rules[i].expression())["row"]
+            rule_index.scatter(matched, i)
+            unmatched.scatter(matched, False)
+
+        unfiltered = [i for i in range(len(self.rules)) if i not in candidate_rows]
+        if unfiltered:
+            first_match = self._first_match(
+                [self.rules[i] for i in unfiltered],
+                [pl.lit(i, dtype=pl.UInt32) for i in unfiltered],
+                pl.lit(None, dtype=pl.UInt32),
             )
-            data_rest = data_rest.join(
-                filtered,
-                on=[
-                    "date",
-                    "account",
-                    "partner",
-                    "desc",
-                    "classification",
-                    "partner_iban",
-                    "amount",
-                    "account1",
-                ],
-                how="anti",
-                join_nulls=True,
+            matched = (
+                rows.with_columns(rule_index)
+                .lazy()
+                .filter(
+                    pl.col("rule_index").is_null()
+                    | (pl.col("rule_index") > unfiltered[0])
+                )
+                .select("row", "rule_index", first_match=first_match)
+                .filter(
+                    pl.col("first_match")
+                    < pl.col("rule_index").fill_null(len(self.rules))
+                )
+                .collect()
             )
-            new_data.append(filtered)
-            if filtered.shape[0] > 0:
-                pass
-                # print(f"Rule '{rule}' matched {filtered.shape[0]} times")
+            rule_index.scatter(matched["row"], matched["first_match"])
+
+        return rule_index
+
+    def profile(self, data: pl.DataFrame) -> pl.DataFrame:
+        """
+        Evaluates every rule on all of its candidate rows (not only those left by earlier rules) and
+        returns per rule: evaluation time, candidate rows, matched rows, rows it matched first and
+        rows it "stole" from later rules also matching them.
+
+        Much slower than apply, meant for finding dead or expensive rules. Also fills rule_to_count.
+        """
+        start = time.perf_counter()
+        candidate_rows = self._candidate_rows(data)
+        prefilter_seconds = time.perf_counter() - start
+
+        rows = data.with_row_index("row")
+        stats = []
+        hits = [pl.DataFrame(schema={"row": pl.UInt32, "rule": pl.UInt32})]
+        for i, rule in enumerate(self.rules):
+            start = time.perf_counter()
+            to_check = rows[candidate_rows[i]] if i in candidate_rows else rows
+            matched = to_check.filter(rule.expression())["row"]
+            seconds = time.perf_counter() - start
+
+            hits.append(
+                pl.DataFrame(
+                    {"row": matched, "rule": i},
+                    schema={"row": pl.UInt32, "rule": pl.UInt32},
+                )
+            )
+            stats.append(
+                {
+                    "rule": i,
+                    "name": str(rule),
+                    "category": rule.category,
+                    "patterns": rule.pattern_summary(),
+                    "prefiltered": i in candidate_rows,
+                    "seconds": seconds,
+                    "candidates": len(to_check),
+                    "matched": len(matched),
+                }
+            )
+
+        first_matches = (
+            pl.concat(hits)
+            .group_by("row")
+            .agg(rule=pl.min("rule"), stolen=pl.len() > 1)
+            .group_by("rule")
+            .agg(first_matched=pl.len(), stolen=pl.sum("stolen"))
+        )
+        profile = (
+            pl.DataFrame(
+                stats,
+                schema={
+                    "rule": pl.UInt32,
+                    "name": pl.String,
+                    "category": pl.String,
+                    "patterns": pl.String,
+                    "prefiltered": pl.Boolean,
+                    "seconds": pl.Float64,
+                    "candidates": pl.Int64,
+                    "matched": pl.Int64,
+                },
+            )
+            .join(first_matches, on="rule", how="left")
+            .with_columns(
+                pl.col("first_matched", "stolen").fill_null(0).cast(pl.UInt32),
+                prefilter_seconds=pl.lit(prefilter_seconds),
+            )
+            .with_columns(dead=pl.col("first_matched") == 0)
+            .sort("rule")
+        )
+
+        for row in profile.iter_rows(named=True):
+            self.rule_to_count[row["name"]] += row["first_matched"]
+
+        return profile
+
+    def match_matrix(self, data: pl.DataFrame) -> "np.ndarray":
+        """
+        Rows matched by every rule (not only first matches) as packed bitsets, one per rule:
+        bit j of row i of the result (see np.packbits) is set if rule i matches row j.
+
+        Rules without literal conditions are evaluated on all rows in a single select. The others are
+        evaluated only on their candidate rows, gathered at once and filtered in a single query.
+        Both run the rules in parallel.
+        """
+        # imported here, as categorizing does not need it
+        import numpy as np
+
+        matrix = np.zeros((len(self.rules), (len(data) + 7) // 8), dtype=np.uint8)
+        candidate_rows = self._candidate_rows(data)
+
+        unfiltered = [i for i in range(len(self.rules)) if i not in candidate_rows]
+        if unfiltered:
+            matches = data.select(
+                self.rules[i].expression().fill_null(False).alias(str(i))
+                for i in unfiltered
+            )
+            for i, column in zip(unfiltered, matches.iter_columns()):
+                matrix[i] = np.packbits(column.to_numpy())
+
+        prefiltered = [i for i in range(len(self.rules)) if i in candidate_rows]
+        if prefiltered:
+            candidates = data.with_row_index("row")[
+                pl.concat([candidate_rows[i] for i in prefiltered])
+            ]
+            offsets = np.cumsum([0] + [len(candidate_rows[i]) for i in prefiltered])
+            hits = pl.concat(
+                candidates.slice(offsets[k], offsets[k + 1] - offsets[k])
+                .lazy()
+                .filter(self.rules[i].expression())
+                .select("row", rule=pl.lit(i, dtype=pl.UInt32))
+                for k, i in enumerate(prefiltered)
+            ).collect()
+            rows = hits["row"].to_numpy()
+            np.bitwise_or.at(
+                matrix,
+                (hits["rule"].to_numpy(), rows >> 3),
+                (0x80 >> (rows & 7)).astype(np.uint8),
+            )
+        return matrix
+
+    def _candidate_rows(self, data: pl.DataFrame) -> dict[int, pl.Series]:
+        """
+        Rows fulfilling the literal conditions of each rule having any (see Rule.literal_conditions).
+        """
+        conditions = pl.DataFrame(
+            [
+                {
+                    "rule": i,
+                    "condition": j,
+                    "column": column,
+                    "literal": literal,
+                }
+                for i, rule in enumerate(self.rules)
+                for j, (columns, literals) in enumerate(rule.literal_conditions())
+                for column in columns
+                for literal in literals
+            ],
+            schema={
+                "rule": pl.UInt32,
+                "condition": pl.UInt32,
+                "column": pl.String,
+                "literal": pl.String,
+            },
+        )
+        if conditions.is_empty():
+            return {}
+
+        hits = []
+        for (column,), literals in conditions.group_by("column"):
+            hits.append(
+                data.select(
+                    pl.int_range(pl.len(), dtype=pl.UInt32).alias("row"),
+                    pl.col(column)
+                    .cast(pl.String)
+                    .str.extract_many(
+                        literals["literal"].unique().to_list(),
+                        ascii_case_insensitive=True,
+                        overlapping=True,
+                    )
+                    .alias("literal"),
+                    pl.lit(column).alias("column"),
+                )
+                .explode("literal")
+                .drop_nulls("literal")
+                .with_columns(pl.col("literal").str.to_lowercase())
+                .unique()
+            )
+
+        conditions_per_rule = conditions.group_by("rule").agg(
+            n_conditions=pl.col("condition").n_unique()
+        )
+        candidates = (
+            pl.concat(hits)
+            .join(conditions, on=["column", "literal"])
+            .group_by("rule", "row")
+            .agg(n_fulfilled=pl.col("condition").n_unique())
+            .join(conditions_per_rule, on="rule")
+            .filter(pl.col("n_fulfilled") == pl.col("n_conditions"))
+            .group_by("rule")
+            .agg(pl.col("row").sort())
+        )
+        candidate_rows = {
+            rule: pl.Series("row", rows, dtype=pl.UInt32)
+            for rule, rows in candidates.iter_rows()
+        }
+        for rule in conditions_per_rule["rule"]:
+            candidate_rows.setdefault(rule, pl.Series("row", [], dtype=pl.UInt32))
+        return candidate_rows
+
+    def category_expression(self) -> pl.Expr:
+        """
+        Category of the first matching rule, or incomes/expenses:unknown if no rule matches.
+
+        Same result as apply, but as a single when/then-chain without literal prefilter,
+        e.g. for use within lazy queries.
+        """
+        return self._first_match(
+            self.rules,
+            [pl.lit(rule.category, dtype=pl.String) for rule in self.rules],
+            self._default_category(),
+        )
+
+    def _default_category(self) -> pl.Expr:
+        return (
+            pl.when(pl.col("amount") > 0)
+            .then(pl.lit("incomes:unknown"))
+            .otherwise(pl.lit("expenses:unknown"))
+        )
+
+    def rule_index_expression(self) -> pl.Expr:
+        """
+        Index into self.rules of the first matching rule, or null if no rule matches.
+        """
+        return self._first_match(
+            self.rules,
+            [pl.lit(i, dtype=pl.UInt32) for i in range(len(self.rules))],
+            pl.lit(None, dtype=pl.UInt32),
+        )
+
+    def _first_match(
+        self, rules: list[Rule], values: list[pl.Expr], default: pl.Expr
+    ) -> pl.Expr:
+        if len(rules) == 0:
+            return default
 
-        result = pl.concat(new_data + [data_rest])
-        return result
+        chain = pl.when(rules[0].expression()).then(values[0])
+        for rule, value in zip(rules[1:], values[1:]):
+            chain = chain.when(rule.expression()).then(value)
+        return chain.otherwise(default)
 
     def apply_legacy(self, data: pl.DataFrame) -> pl.DataFrame:
         if not set(bank_transaction_columns).issubset(data.columns):
@@ -1,35 +1,94 @@
+from datetime import date, datetime
+import json
 import yaml
 from pathlib import Path
+import polars as pl
+import file_cache
 from rule import Rule
 
+# increased when Rule changes, such that cached rules are not used anymore
+CACHE_VERSION = "2"
+# the C implementation of libyaml is much faster, if pyyaml was built with it
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 class RulesParser:
+    def __init__(self, cache_dir: Path | None = None):
+        """
+        If a cache_dir is given, the checked arguments of the rules of every file (see Rule.validate)
+        are stored there as json and used instead of reading and checking the file again as long as
+        it does not change. Json, unlike pickle, runs no code when loaded, so a cache in a synced or
+        shared working directory can at most give wrong rules, like the rule files themselves.
+        """
+        self.cache_dir = cache_dir
+
     def parse(self, rules_folder: Path) -> list[Rule]:
         rules = []
+        cache_files = []
         for yaml_file in sorted(rules_folder.glob("*.yml")):
-            rules_raw, defaults = self._read_single_rule_file(yaml_file)
-            rules_of_single_file = self._parse_rules_of_single_file(rules_raw, defaults)
-            rules += rules_of_single_file
+            cache_file = self._cache_file(yaml_file)
+            cache_files.append(cache_file)
+            if cache_file is not None and cache_file.exists():
+                with open(cache_file, encoding="utf-8") as file:
+                    rule_arguments = json.load(file, object_hook=_decode_dates)
+            else:
+                rules_raw, defaults = self._read_single_rule_file(yaml_file)
+                rule_arguments = self._parse_rules_of_single_file(
+                    rules_raw, defaults, yaml_file
+                )
+                if cache_file is not None:
+                    with (
+                        file_cache.writing(cache_file) as temp_file,
+                        open(temp_file, "w", encoding="utf-8") as file,
+                    ):
+                        json.dump(rule_arguments, file, default=_encode_dates)
+            rules += [Rule(**arguments) for arguments in rule_arguments]
 
             # print(f"Loaded {len(rules_of_single_file)} rules from {yaml_file}.")
+        # including those of former versions, e.g. pickles
+        file_cache.remove_unused(self.cache_dir, cache_files)
 
         print(f"    Loaded {len(rules)} rules in total")
 
         return rules
 
-    def _parse_rules_of_single_file(self, rules_raw, defaults):
+    def _cache_file(self, yaml_file: Path) -> Path | None:
+        if self.cache_dir is None:
+            return None
+        return file_cache.cache_file(
+            self.cache_dir, yaml_file, [CACHE_VERSION, pl.__version__], ".json"
+        )
+
+    def _parse_rules_of_single_file(
+        self, rules_raw, defaults, yaml_file: Path
+    ) -> list[dict]:
+        """
+        Returns the arguments of the rules, with the defaults of the file applied.
+        Raises a ValueError naming the file and the position of the first invalid rule.
+        """
         rules_single_file = []
-        for rule_raw in rules_raw:
-            base = {}
-            base.update(defaults)
-            base.update(rule_raw)
-            rules_single_file.append(Rule(**rule_raw))
+        for position, rule_raw in enumerate(rules_raw, start=1):
+            try:
+                if type(rule_raw) is not dict:
+                    raise ValueError(f"a rule must be a dict, not {type(rule_raw)}")
+                base = {}
+                base.update(defaults)
+                base.update(rule_raw)
+                # the name used in the readme
+                if "date_begin" in base:
+                    base["date_start"] = base.pop("date_begin")
+                Rule(**base).validate()
+                rules_single_file.append(base)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Rule {position} in {yaml_file}: {e}") from e
 
         return rules_single_file
 
-    def _read_single_rule_file(self, yaml_file):
-        with open(yaml_file, mode="r", encoding="utf-8") as file:
-            rules_dict = yaml.load(file, Loader=yaml.FullLoader)
+    def _read_single_rule_file(self, yaml_file: Path):
+        with open(yaml_file, encoding="utf-8") as file:
+            rules_dict = yaml.load(file, Loader=YamlLoader) or {}
+        if type(rules_dict) is not dict:
+            raise ValueError(f"{yaml_file} must contain a dict, not {type(rules_dict)}")
 
         rules_raw: list[dict[str, str]] = (
             rules_dict["rules"] if "rules" in rules_dict and rules_dict["rules"] else []
@@ -45,3 +104,20 @@ class RulesParser:
         if type(rules_raw) is not list:
             raise ValueError(f"rules must be a list, not {type(rules_raw)}")
         return rules_raw, defaults
+
+
+def _encode_dates(value) -> dict:
+    # yaml reads unquoted dates like 2024-01-01 as dates, which json has no type for
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"{type(value)} is not serializable")
+
+
+def _decode_dates(value: dict):
+    if value.keys() == {"$datetime"}:
+        return datetime.fromisoformat(value["$datetime"])
+    if value.keys() == {"$date"}:
+        return date.fromisoformat(value["$date"])
+    return value
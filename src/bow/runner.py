@@ -1,4 +1,7 @@
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable
 import os
 
 import sys
@@ -6,33 +9,113 @@ import sys
 sys.path.append(str(Path(__file__).parent.absolute()))
 
 from parser import (
+    TRANSACTION_ID_VERSION,
     ConfigFileBasedParser,
+    bank_transaction_columns,
     bank_transaction_columns_categorized,
     bank_transaction_data_schema,
+    transaction_id,
 )
 import polars as pl
 from rules_applier import RulesApplier
+from category_cache import CategoryCache
+from rule_statistics import RuleStatistics
+from output_writer import OutputWriter
+from manual_store import ManualStore, manual_columns
+from amazon_orders import AmazonOrderIndex
+from balance_checkpoints import BalanceCheckpoints
 from rules_parser import RulesParser
 from rule import Rule
-from analyzer import TransactionVisualizer
+from profiling import rows, trace
 import yaml
 import argparse
 
+STAGES = ["import", "rules", "manual", "output", "analyze"]
+
 parser = argparse.ArgumentParser(description="Booking Organization Flow.")
+parser.add_argument(
+    "command",
+    nargs="?",
+    choices=["run", "watch"],
+    default="run",
+    help="run the stages once, or keep them in memory and rerun them on changes of the workspace",
+)
 parser.add_argument("-f", "--folder", help="folder to work in", default=".")
+parser.add_argument(
+    "--stages",
+    nargs="+",
+    choices=STAGES,
+    default=STAGES,
+    help="stages to run, earlier stages needed by them always run (default: all)",
+)
+parser.add_argument(
+    "--interval",
+    type=float,
+    default=0.5,
+    help="seconds between checks for changes in watch mode",
+)
+parser.add_argument(
+    "--rule-statistics",
+    action="store_true",
+    help="profile every rule and write rule_statistics.json/.csv to 4_output",
+)
+parser.add_argument(
+    "--rule-overlaps",
+    action="store_true",
+    help="write overlapping, shadowed and conflicting rules to rule_overlaps.json/.csv in 4_output",
+)
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="write time, memory and row counts of every stage and step to 4_output/profile.json",
+)
+parser.add_argument(
+    "--lazy",
+    action="store_true",
+    help="build import, rules and manual stages as one lazy query, collected once",
+)
+parser.add_argument(
+    "--explain",
+    action="store_true",
+    help="print the optimized query plan of the lazy pipeline (implies --lazy)",
+)
 
 
 class Main:
-    def __init__(self, working_dir: Path):
+    def __init__(
+        self,
+        working_dir: Path,
+        rule_statistics: bool = False,
+        rule_overlaps: bool = False,
+        lazy: bool = False,
+        explain: bool = False,
+        stages: list[str] = STAGES,
+        profile: bool = False,
+    ):
+        """
+        If lazy, the stages up to _3_manual build on one LazyFrame, which is collected once
+        in _3_manual. If explain, its optimized plan is printed before.
+
+        Only the given stages are run, see run.
+
+        If profile, a trace of every run with wall time, cpu time, peak memory and row counts of its
+        stages and their steps is written to 4_output/profile.json, with explain including the plans.
+        """
         self.working_dir = working_dir
-        self.config = {}
+        self.rule_statistics = rule_statistics
+        self.rule_overlaps = rule_overlaps
+        self.profile = profile
+        self.lazy = lazy or explain
+        self.explain = explain
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown stages {sorted(unknown)}, choose from {STAGES}")
+        self.stages = stages
         self.config_file = self.working_dir / "config.yml"
-        if os.path.exists(self.config_file):
-            print(f"Found config file in {self.config_file}")
-            with open(self.config_file, encoding="utf-8") as file:
-                self.config = yaml.load(file, Loader=yaml.FullLoader)
-        else:
-            print(f"No config file {self.config_file} found.")
+        self.cache_dir = self.working_dir / ".bow_cache"
+        # see _collect_all
+        self._collections = 0
+        self.read_config()
 
         for folder in [
             "1_imports",
@@ -44,6 +127,15 @@ class Main:
         ]:
             (self.working_dir / folder).mkdir(exist_ok=True, parents=True)
 
+    def read_config(self):
+        self.config = {}
+        if os.path.exists(self.config_file):
+            print(f"Found config file in {self.config_file}")
+            with open(self.config_file, encoding="utf-8") as file:
+                self.config = yaml.load(file, Loader=yaml.FullLoader) or {}
+        else:
+            print(f"No config file {self.config_file} found.")
+
     def _1_import(self):
         print("Importing transactions..")
         parsed = self._parse_transactions()
@@ -51,6 +143,8 @@ class Main:
             print("No transactions found, exiting.")
             sys.exit(0)
         combined_transactions = pl.concat(parsed.values())
+        if self.lazy:
+            combined_transactions = combined_transactions.lazy()
         combined_transactions_enriched = self._enrich_transactions_with_amazon_data(
             combined_transactions
         )
@@ -60,55 +154,62 @@ class Main:
         return combined_transactions_enriched_with_balance_corrections
 
     def _parse_transactions(self):
-        parsed = {}
-        for folder in (self.working_dir / "1_imports" / "bank").iterdir():
-            if folder.is_file():
-                continue
-            parsed[folder] = ConfigFileBasedParser(folder=folder).parse()
+        """
+        Folders and their files are parsed by parallel_workers threads (see config.yml).
+        Polars releases the GIL while reading, so this scales with the number of cores.
+        """
+        workers = self.config.get("1_imports", {}).get("parallel_workers", 1)
+        folders = sorted(
+            folder
+            for folder in (self.working_dir / "1_imports" / "bank").iterdir()
+            if folder.is_dir()
+        )
+
+        import_span = trace.current()
+
+        def parse_folder(
+            folder: Path, file_executor: ThreadPoolExecutor
+        ) -> pl.DataFrame:
+            with trace.span(f"bank/{folder.name}", import_span) as span:
+                parsed = ConfigFileBasedParser(
+                    folder=folder,
+                    executor=file_executor,
+                    cache_dir=self.cache_dir / "imports" / "bank" / folder.name,
+                ).parse()
+                span["rows_out"] = len(parsed)
+                return parsed
+
+        # separate pools, such that folders waiting for their files never block the files
+        with (
+            ThreadPoolExecutor(workers) as folder_executor,
+            ThreadPoolExecutor(workers) as file_executor,
+        ):
+            parsed_folders = folder_executor.map(
+                lambda folder: parse_folder(folder, file_executor), folders
+            )
+            parsed = dict(zip(folders, parsed_folders))
 
         return parsed
 
     def _enrich_transactions_with_amazon_data(
-        self, combined_transactions: pl.DataFrame
+        self, combined_transactions: pl.DataFrame | pl.LazyFrame
     ):
         amazon_folder = self.working_dir / "1_imports" / "amazon"
         if not amazon_folder.exists():
             return combined_transactions
 
-        amazon_all = (
-            ConfigFileBasedParser(folder=self.working_dir / "1_imports" / "amazon")
-            .parse()
-            .group_by("amazon_order_id")
-            .first()
-        )
-
-        combined_with_amazon_info = (
-            combined_transactions.with_columns(
-                amazon_order_id=pl.when(pl.col("partner").str.contains("AMAZON")).then(
-                    pl.col("desc").str.split(" ").list.first()
-                ),
-            )
-            .sort("date", descending=True)
-            .join(
-                amazon_all,
-                on="amazon_order_id",
-                how="left",
-            )
-            .with_columns(
-                desc=pl.when(pl.col("desc_order").is_not_null())
-                .then(pl.col("desc") + " amazon_product:" + pl.col("desc_order"))
-                .otherwise(pl.col("desc"))
+        with trace.span("amazon join", rows_in=rows(combined_transactions)) as span:
+            combined_with_amazon_info = AmazonOrderIndex(
+                amazon_folder, self.cache_dir / "imports" / "amazon"
+            ).enrich(
+                combined_transactions,
+                max_days=self.config.get("1_imports", {}).get("amazon_max_days", 30),
             )
-        ).drop(
-            "desc_order",
-            "account_right",
-            "amazon_order_id",
-            "date_right",
-        )
+            span["rows_out"] = rows(combined_with_amazon_info)
 
         return combined_with_amazon_info
 
-    def _correct_balance(self, combined_transactions: pl.DataFrame):
+    def _correct_balance(self, combined_transactions: pl.DataFrame | pl.LazyFrame):
         online_balances_file = self.working_dir / "1_imports" / "online_balances.csv"
         if not online_balances_file.exists():
             print(
@@ -116,64 +217,111 @@ class Main:
             )
             return combined_transactions
 
-        daily_balances = (
-            combined_transactions.sort("date", "account")
-            .group_by("account", "date", maintain_order=True)
-            .agg(amount=pl.col("amount").sum())
-            .with_columns(
-                balance=pl.cum_sum("amount").over(
-                    "account", order_by="date", mapping_strategy="group_to_rows"
-                )
-            )
-            .sort("account", "date")
-        ).select("date", "account", "balance")
-
-        real_balances = (
-            pl.read_csv(
-                online_balances_file,
-                try_parse_dates=True,
-                schema_overrides={"amount": pl.Float64},
-            )
-            .with_columns(
-                desc=pl.lit("Balance correction according to online status"),
-                account1=pl.lit("account:") + pl.col("account"),
-                account2=pl.lit("balance_correction"),
-            )
-            .sort("date")
+        online_balances = pl.read_csv(
+            online_balances_file,
+            try_parse_dates=True,
+            schema_overrides={"online_balance": pl.Float64},
         )
 
-        correction_transactions = (
-            real_balances.join_asof(
-                daily_balances, on="date", by="account", strategy="backward"
-            )
-            .sort("account", "date")
-            .with_columns(agb=(pl.col("online_balance") - pl.col("balance")).round(2))
-            .with_columns(last_agb=pl.col("agb").shift(1).over("account").fill_null(0))
-            .with_columns(agb_final=pl.col("agb") - pl.col("last_agb"))
-            .with_columns(
-                amount=pl.col("agb_final"),
-                partner=None,
-                classification=None,
-                partner_iban=None,
-            )
-            .select(combined_transactions.columns)
-        ).filter(pl.col("amount").abs() > 0)
+        def add_corrections(transactions: pl.DataFrame) -> pl.DataFrame:
+            with trace.span("balance correction", rows_in=len(transactions)) as span:
+                corrections = BalanceCheckpoints(self.cache_dir).corrections(
+                    transactions, online_balances
+                )
+                correction_transactions = (
+                    corrections.filter(pl.col("correction").abs() > 0)
+                    .sort("account", "date")
+                    .with_columns(
+                        amount=pl.col("correction"),
+                        desc=pl.lit("Balance correction according to online status"),
+                        partner=pl.lit(None, dtype=pl.String),
+                        classification=pl.lit(None, dtype=pl.String),
+                        partner_iban=pl.lit(None, dtype=pl.String),
+                    )
+                    .with_columns(transaction_id(bank_transaction_columns))
+                    .select(transactions.columns)
+                )
+                span["rows_out"] = len(transactions) + len(correction_transactions)
+                return pl.concat([transactions, correction_transactions])
 
-        transactions_corr = pl.concat(
-            [combined_transactions, correction_transactions]
-        ).sort("date")
+        transactions_corr = self._map_once(combined_transactions, add_corrections)
 
         return transactions_corr
 
-    def _2_rules(self, combined_transactions_enriched: pl.DataFrame):
+    def _2_rules(self, combined_transactions_enriched: pl.DataFrame | pl.LazyFrame):
         print("Applying rules..")
-        rules: list[Rule] = RulesParser().parse(self.working_dir / "2_rules")
-        categorized_transactions = RulesApplier(rules).apply(
-            combined_transactions_enriched
+        rules: list[Rule] = RulesParser(self.cache_dir / "rules").parse(
+            self.working_dir / "2_rules"
+        )
+        applier = RulesApplier(rules)
+
+        schema = combined_transactions_enriched.collect_schema()
+        categorized_transactions = self._map_once(
+            combined_transactions_enriched,
+            lambda transactions: self._categorize(applier, transactions),
+            pl.Schema({**schema, "account1": pl.String, "account2": pl.String}),
         )
         return categorized_transactions
 
-    def _3_manual(self, categorized_transactions: pl.DataFrame):
+    def _map_once(
+        self,
+        frame: pl.DataFrame | pl.LazyFrame,
+        function: Callable[[pl.DataFrame], pl.DataFrame],
+        schema: pl.Schema | None = None,
+    ) -> pl.DataFrame | pl.LazyFrame:
+        """
+        Applies function to the frame, for a LazyFrame as a step of its plan getting all rows at once
+        (e.g. the literal prefilter and the caches need all transactions), so nothing is pushed into it.
+
+        Polars does not share such opaque python steps between the plans collected together in
+        3_manual, so the step may be called several times per collection, even concurrently.
+        As nothing is pushed into it, it gets the same transactions every time, so the result is
+        computed only once per collection (see _collect_all).
+        """
+        if not isinstance(frame, pl.LazyFrame):
+            return function(frame)
+
+        last: dict[str, int | pl.DataFrame] = {}
+        lock = Lock()
+
+        def function_once(transactions: pl.DataFrame) -> pl.DataFrame:
+            with lock:
+                if last.get("collection") != self._collections:
+                    last["collection"] = self._collections
+                    last["output"] = function(transactions)
+                return last["output"]
+
+        return frame.map_batches(
+            function_once,
+            schema=schema or frame.collect_schema(),
+            predicate_pushdown=False,
+            projection_pushdown=False,
+            slice_pushdown=False,
+        )
+
+    def _categorize(
+        self, applier: RulesApplier, transactions: pl.DataFrame
+    ) -> pl.DataFrame:
+        if self.rule_statistics:
+            with trace.span("rule statistics", rows_in=len(transactions)):
+                RuleStatistics(applier.profile(transactions)).write(
+                    self.working_dir / "4_output"
+                )
+        if self.rule_overlaps:
+            # imported here, as only this report needs numpy
+            from rule_overlaps import RuleOverlaps
+
+            with trace.span("rule overlaps", rows_in=len(transactions)):
+                RuleOverlaps(applier, transactions).write(self.working_dir / "4_output")
+        with trace.span("categorize", rows_in=len(transactions)) as span:
+            if self.config.get("2_rules", {}).get("incremental", True):
+                categorized = CategoryCache(self.cache_dir).apply(applier, transactions)
+            else:
+                categorized = applier.apply(transactions)
+            span["rows_out"] = len(categorized)
+            return categorized
+
+    def _3_manual(self, categorized_transactions: pl.DataFrame | pl.LazyFrame):
         uncategorized_pattern = self.config.get("3_manual", {}).get(
             "uncategorized_pattern", "unknown"
         )
@@ -183,58 +331,58 @@ class Main:
         )
         todo_file = self.working_dir / "3_manual" / "todo.csv"
         done_file = self.working_dir / "3_manual" / "done.csv"
+        store = ManualStore(self.working_dir / "3_manual" / "manual_categories.sqlite")
+        rematch = store.id_version() != TRANSACTION_ID_VERSION
+        if rematch:
+            with trace.span("rematch manual categories"):
+                stored = store.read().drop("transaction_id")
+                (rematched_df,) = self._collect_all(
+                    self._with_transaction_ids(
+                        self._like(stored, categorized_transactions),
+                        categorized_transactions,
+                    )
+                )
+                rematched = store.replace(rematched_df, TRANSACTION_ID_VERSION)
+            if len(stored):
+                print(
+                    f"    Matched {rematched} of {len(stored)} manual categories to new ids"
+                )
 
-        if not todo_file.exists():
-            todo_df = categorized_transactions.filter(
-                pl.col("account2").str.contains(uncategorized_pattern)
-            )
-            todo_df.write_csv(todo_file)
-        else:
-            todo_df = pl.read_csv(
-                todo_file,
-                try_parse_dates=True,
-                schema_overrides=bank_transaction_data_schema,
-            )
-
-        if not done_file.exists():
-            done_df = todo_df[:0]
-            done_df.write_csv(done_file)
-        else:
-            done_df = pl.read_csv(
-                done_file,
-                try_parse_dates=True,
-                schema_overrides=bank_transaction_data_schema,
-            )
-
-        join_cols = bank_transaction_columns_categorized
-        join_cols.remove("account2")
-
-        todo_done_together = pl.concat([todo_df, done_df])
-
-        new_done_df = todo_done_together.filter(
-            ~pl.col("account2").str.contains(uncategorized_pattern)
+        todo_df, done_df = [
+            self._read_manual_file(file, categorized_transactions, rematch)
+            for file in [todo_file, done_file]
+        ]
+        edited = pl.concat([todo_df, done_df]).unique(
+            "transaction_id", keep="first", maintain_order=True
         )
+        is_uncategorized = pl.col("account2").str.contains(uncategorized_pattern)
+        with trace.span("manual store", rows_in=len(edited)) as span:
+            upserted = store.upsert(edited.filter(~is_uncategorized))
+            # setting a category in done.csv back to uncategorized removes it from the store,
+            # unless todo.csv, which takes precedence, has a category for the same transaction
+            deleted = store.delete(edited.filter(is_uncategorized)["transaction_id"])
+            if upserted or deleted:
+                print(
+                    f"    Stored {upserted} new and removed {deleted} manual categories"
+                )
 
-        new_todo_df = categorized_transactions.filter(
-            pl.col("account2").str.contains(uncategorized_pattern)
-        ).join(
-            new_done_df,
-            on=join_cols,
-            join_nulls=True,
+            manual_df = store.read()
+            span["rows_out"] = len(manual_df)
+        new_todo_df = categorized_transactions.filter(is_uncategorized).join(
+            self._like(manual_df.select("transaction_id"), categorized_transactions),
+            on="transaction_id",
             how="anti",
         )
 
-        new_todo_df.sort(bank_transaction_columns_categorized, descending=True).write_csv(
-            todo_file
-        )
-
-        new_done_df.sort(bank_transaction_columns_categorized, descending=True).write_csv(
-            done_file
-        )
-
         enriched_transactions = (
             categorized_transactions.join(
-                new_done_df, on=join_cols, how="left", join_nulls=True
+                self._like(
+                    manual_df.select("transaction_id", "account2"),
+                    categorized_transactions,
+                ),
+                on="transaction_id",
+                how="left",
+                suffix="_right",
             )
             .with_columns(
                 account2=pl.when(pl.col("account2_right").is_not_null())
@@ -244,14 +392,127 @@ class Main:
             .drop("account2_right")
         ).sort("date", descending=False)
 
+        enriched_transactions, new_todo_df = self._collect(
+            enriched_transactions,
+            new_todo_df.select(manual_columns).sort(
+                bank_transaction_columns_categorized, descending=True
+            ),
+        )
+
+        # todo.csv and done.csv are views, only written when they differ from the files
+        for file, old_df, new_df in [
+            (todo_file, todo_df, new_todo_df),
+            (
+                done_file,
+                done_df,
+                manual_df.sort(bank_transaction_columns_categorized, descending=True),
+            ),
+        ]:
+            if not file.exists() or not old_df.equals(new_df):
+                new_df.write_csv(file)
+
         return enriched_transactions
 
+    def _read_manual_file(
+        self,
+        file: Path,
+        categorized_transactions: pl.DataFrame | pl.LazyFrame,
+        rematch: bool = False,
+    ) -> pl.DataFrame:
+        """
+        If rematch, the ids in the file are outdated and matched again like in files without ids.
+        """
+        if not file.exists():
+            return pl.DataFrame(
+                schema={
+                    col: bank_transaction_data_schema[col] for col in manual_columns
+                }
+            )
+
+        manual_df = pl.read_csv(
+            file,
+            try_parse_dates=True,
+            schema_overrides=bank_transaction_data_schema,
+        )
+        if rematch:
+            manual_df = manual_df.drop("transaction_id", strict=False)
+        if "transaction_id" not in manual_df.columns:
+            (manual_df,) = self._collect_all(
+                self._with_transaction_ids(
+                    self._like(manual_df, categorized_transactions),
+                    categorized_transactions,
+                ).select(manual_columns)
+            )
+            manual_df.write_csv(file)
+        return manual_df.select(manual_columns)
+
+    def _like(
+        self, df: pl.DataFrame, reference: pl.DataFrame | pl.LazyFrame
+    ) -> pl.DataFrame | pl.LazyFrame:
+        return df.lazy() if isinstance(reference, pl.LazyFrame) else df
+
+    def _collect(self, *frames: pl.DataFrame | pl.LazyFrame) -> list[pl.DataFrame]:
+        """
+        Collects lazy frames at once, such that their common parts are computed only once.
+        """
+        if not isinstance(frames[0], pl.LazyFrame):
+            return list(frames)
+
+        with trace.span("collect") as span:
+            if self.explain:
+                for name, frame in zip(["transactions", "todo"], frames):
+                    plan = frame.explain()
+                    print(f"Optimized plan of {name}:")
+                    print(plan)
+                    span[f"plan of {name}"] = plan
+            collected = self._collect_all(*frames)
+            span["rows_out"] = [len(frame) for frame in collected]
+            return collected
+
+    def _collect_all(self, *frames: pl.DataFrame | pl.LazyFrame) -> list[pl.DataFrame]:
+        """
+        Every collection is counted, such that the steps of _map_once know which of their calls
+        belong to the same one.
+        """
+        self._collections += 1
+        return pl.collect_all(frame.lazy() for frame in frames)
+
+    def _with_transaction_ids(
+        self,
+        manual_df: pl.DataFrame | pl.LazyFrame,
+        categorized_transactions: pl.DataFrame | pl.LazyFrame,
+    ) -> pl.DataFrame | pl.LazyFrame:
+        """
+        Files and stores written before transactions had their current ids are matched once on all
+        their columns.
+        """
+        return manual_df.join(
+            categorized_transactions.select(
+                bank_transaction_columns + ["account1", "transaction_id"]
+            ),
+            on=bank_transaction_columns + ["account1"],
+            how="inner",
+            join_nulls=True,
+        )
+
     def _4_output(self, enriched_transactions: pl.DataFrame):
         print("Writing output..")
-        enriched_transactions.write_csv(self.working_dir / "4_output" / "output.csv")
+        output_config = self.config.get("4_output", {})
+        OutputWriter(
+            self.working_dir / "4_output",
+            output_config.get("formats", ["csv"]),
+            output_config.get("hledger_currency", "€"),
+        ).write(
+            enriched_transactions.select(
+                bank_transaction_columns_categorized + ["transaction_id"]
+            )
+        )
 
     def _5_analyze(self, enriched_transactions: pl.DataFrame):
         print("Analyzing transactions..")
+        # imported here, as altair and vegafusion take longer to import than most runs without them
+        from analyzer import TransactionVisualizer
+
         plots_config = self.config.get("5_analysis", {}).get("plots", {})
 
         TransactionVisualizer(enriched_transactions, **plots_config).run(
@@ -259,21 +520,72 @@ class Main:
         )
 
     def run(self):
-        imported = self._1_import()
-        categorized = self._2_rules(imported)
-        manual = self._3_manual(categorized)
-
-        self._4_output(manual)
-        self._5_analyze(manual)
-
-        return manual
+        """
+        The stages import, rules and manual are run up to the last given stage, as every stage
+        needs the transactions of the previous one. Output and analyze are only run if given,
+        e.g. stages ["rules"] imports and categorizes the transactions without writing anything.
+        """
+        return list(self.run_stages().values())[-1]
+
+    def run_stages(
+        self, results: dict[str, pl.DataFrame] = {}
+    ) -> dict[str, pl.DataFrame]:
+        """
+        Like run, but returns the transactions after each of the stages import, rules and manual.
+        Stages whose transactions are given in results are not run again.
+        """
+        if self.profile:
+            trace.enable()
+        results = dict(results)
+        last_stage = max(STAGES.index(stage) for stage in self.stages)
+        steps = {
+            "import": lambda: self._1_import(),
+            "rules": lambda: self._2_rules(results["import"]),
+            "manual": lambda: self._3_manual(results["rules"]),
+        }
+        for stage, step in steps.items():
+            if STAGES.index(stage) > last_stage:
+                break
+            if stage not in results:
+                previous = list(results.values())[-1] if results else None
+                with trace.span(stage, rows_in=rows(previous)) as span:
+                    results[stage] = step()
+                    span["rows_out"] = rows(results[stage])
+
+        last_result = list(results)[-1]
+        (results[last_result],) = self._collect(results[last_result])
+        transactions = results[last_result]
+        for stage, step in [("output", self._4_output), ("analyze", self._5_analyze)]:
+            if stage in self.stages:
+                with trace.span(stage, rows_in=len(transactions)):
+                    step(transactions)
+
+        if self.profile:
+            trace.write(self.working_dir / "4_output" / "profile.json")
+        return results
 
 
 def main():
     args = parser.parse_args()
     if args.folder == ".":
         args.folder = os.getcwd()
-    Main(Path(args.folder)).run()
+    if args.command == "watch" and (args.lazy or args.explain):
+        parser.error("watch keeps the transactions of every stage and cannot be --lazy")
+    main = Main(
+        Path(args.folder),
+        rule_statistics=args.rule_statistics,
+        rule_overlaps=args.rule_overlaps,
+        lazy=args.lazy,
+        explain=args.explain,
+        stages=args.stages,
+        profile=args.profile,
+    )
+    if args.command == "watch":
+        from watcher import Watcher
+
+        Watcher(main, args.interval).watch()
+    else:
+        main.run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+from pathlib import Path
+import sys
+import polars as pl
+from datetime import date
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from amazon_orders import AmazonOrderIndex
+
+folder = Path(__file__).parent / "test_files" / "amazon"
+
+
+def test_overlapping_exports_are_deduplicated(tmp_path: Path, capsys):
+    AmazonOrderIndex(folder, tmp_path).orders()
+    assert capsys.readouterr().out.count("Parsing") == 2
+    cached_files = list(tmp_path.iterdir())
+    orders = AmazonOrderIndex(folder, tmp_path).orders().sort("amazon_order_id")
+    assert "Parsing" not in capsys.readouterr().out
+    # nothing is written when nothing changed
+    assert [file.stat().st_mtime_ns for file in cached_files] == [
+        file.stat().st_mtime_ns for file in tmp_path.iterdir()
+    ]
+    assert orders["desc_order"].to_list() == [
+        "Buch",
+        "USB Kabel",
+        "Filter, Kaffeebohnen",
+    ]
+    assert orders["total"].to_list() == [20.0, 12.5, 20.98]
+    assert orders["date"].to_list() == [
+        date(2024, 2, 10),
+        date(2024, 1, 1),
+        date(2024, 1, 3),
+    ]
+
+
+def test_matching_by_order_id_and_by_amount(tmp_path: Path):
+    transactions = pl.DataFrame(
+        {
+            "date": [
+                date(2024, 3, 1),
+                date(2024, 1, 5),
+                date(2024, 2, 12),
+                date(2024, 4, 1),
+            ],
+            "partner": ["Paypal", "AMAZON PAYMENTS", "Amazon EU", "AMAZON EU"],
+            "desc": [
+                "302-1234567-1234567",
+                "Lastschrift",
+                "Lastschrift",
+                "Lastschrift",
+            ],
+            "amount": [-12.5, -20.98, -20.0, -20.0],
+        }
+    )
+    index = AmazonOrderIndex(folder, tmp_path)
+    enriched = index.enrich(transactions)
+    assert enriched["desc"].to_list() == [
+        "302-1234567-1234567 amazon_product:USB Kabel",
+        "Lastschrift amazon_product:Filter, Kaffeebohnen",
+        "Lastschrift amazon_product:Buch",
+        # too long after the order
+        "Lastschrift",
+    ]
+    assert index.enrich(transactions.lazy()).collect().equals(enriched)
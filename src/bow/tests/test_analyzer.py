@@ -0,0 +1,101 @@
+from pathlib import Path
+import sys
+import polars as pl
+from datetime import date, datetime
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from analyzer import TransactionVisualizer, _file_names
+from downsampling import end_of_period, largest_triangle_three_buckets
+
+
+def get_transactions() -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "date": [
+                date(2023, 12, 1),
+                date(2024, 1, 2),
+                date(2024, 1, 2),
+                date(2024, 1, 20),
+                date(2024, 2, 1),
+            ],
+            "account": ["DKB", "DKB", "DKB", "N26", "DKB"],
+            "amount": [100.0, -3.0, -4.5, 50.0, -10.0],
+            "account1": ["account:DKB"] * 3 + ["account:N26", "account:DKB"],
+            "account2": [
+                "incomes:salary",
+                "expenses:coffee",
+                "expenses:coffee",
+                "incomes:salary",
+                "expenses:food",
+            ],
+        }
+    )
+
+
+def test_cube_and_daily_balances():
+    visualizer = TransactionVisualizer(
+        get_transactions(), date_begin=datetime(2024, 1, 1), account_pattern="DKB"
+    )
+    assert visualizer.cube.select("month", "account2", "sum", "count").rows() == [
+        (1, "expenses:coffee", -7.5, 2),
+        (2, "expenses:food", -10.0, 1),
+    ]
+    # balances start with the transactions before date_begin
+    assert visualizer.daily_balances["stand"].to_list() == [92.5, 82.5]
+    assert visualizer.get_combined_plots() is not None
+
+
+def test_downsampling_keeps_peaks_and_caps_points():
+    days = pl.datetime_range(
+        datetime(2020, 1, 1), datetime(2020, 12, 31), "1d", eager=True
+    )
+    balances = pl.DataFrame(
+        {
+            "date": days,
+            "stand": [1000.0 if i == 100 else float(i % 7) for i in range(len(days))],
+        }
+    )
+    downsampled = largest_triangle_three_buckets(balances, 50)
+    assert len(downsampled) == 50
+    assert downsampled["stand"].max() == 1000.0
+    assert downsampled["date"].is_sorted()
+    assert downsampled["date"][-1] == balances["date"][-1]
+
+    monthly = end_of_period(balances, "1mo")
+    assert len(monthly) == 12
+    assert monthly["date"][0] == datetime(2020, 1, 31)
+
+
+def test_split_plots_with_index(tmp_path: Path):
+    TransactionVisualizer(
+        get_transactions(),
+        date_begin=datetime(2024, 1, 1),
+        split=True,
+        render_workers=2,
+    ).run(tmp_path)
+
+    (plots_dir,) = tmp_path.iterdir()
+    assert sorted(file.name for file in plots_dir.iterdir()) == [
+        "balances per account.html",
+        "categories of DKB.html",
+        "categories of N26.html",
+        "categories of all accounts.html",
+        "index.html",
+        "overall balance.html",
+    ]
+    assert "categories%20of%20DKB.html" in (plots_dir / "index.html").read_text()
+
+
+def test_accounts_with_same_file_name_keep_their_plots():
+    transactions = get_transactions().with_columns(
+        account=pl.when(pl.col("account") == "DKB")
+        .then(pl.lit("a:b"))
+        .otherwise(pl.lit("a/b"))
+    )
+    plots = TransactionVisualizer(transactions).get_plots()
+    assert "categories of a:b" in plots and "categories of a/b" in plots
+    assert _file_names(list(plots))[-2:] == [
+        "categories of a_b",
+        "categories of a_b (2)",
+    ]
@@ -0,0 +1,62 @@
+from pathlib import Path
+import sys
+import polars as pl
+from datetime import date
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from balance_checkpoints import BalanceCheckpoints
+from parser import transaction_id
+
+
+def get_transactions(amounts: list[float]) -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "date": [date(2024, month, 1) for month in range(1, len(amounts) + 1)],
+            "account": "DKB",
+            "amount": amounts,
+        }
+    ).with_columns(transaction_id(["date", "account", "amount"]))
+
+
+def get_online_balances(balances: list[float]) -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "date": [date(2024, month, 15) for month in range(1, len(balances) + 1)],
+            "account": "DKB",
+            "online_balance": balances,
+        }
+    )
+
+
+def test_incremental_corrections_equal_full_ones(tmp_path: Path, capsys):
+    checkpoints = BalanceCheckpoints(tmp_path)
+    checkpoints.corrections(
+        get_transactions([100, -20]), get_online_balances([100, 85])
+    )
+    assert capsys.readouterr().out == "    Computed 2 balance checkpoints\n"
+
+    transactions = get_transactions([100, -20, -30])
+    online_balances = get_online_balances([100, 85, 50])
+    incremental = checkpoints.corrections(transactions, online_balances)
+    assert "2 balance checkpoints unchanged, 1 changed" in capsys.readouterr().out
+    full = BalanceCheckpoints(tmp_path / "full").corrections(
+        transactions, online_balances
+    )
+    assert incremental.equals(full)
+    assert incremental["correction"].to_list() == [0.0, 5.0, -5.0]
+
+
+def test_changed_transactions_invalidate_checkpoints(tmp_path: Path, capsys):
+    checkpoints = BalanceCheckpoints(tmp_path)
+    checkpoints.corrections(
+        get_transactions([100, -20]), get_online_balances([100, 85])
+    )
+    capsys.readouterr()
+
+    corrections = checkpoints.corrections(
+        get_transactions([90, -20]), get_online_balances([100, 85])
+    )
+    # the correction of the second checkpoint stays the same, as its difference does so
+    assert "1 balance checkpoints unchanged, 1 changed" in capsys.readouterr().out
+    assert corrections["correction"].to_list() == [10.0, 5.0]
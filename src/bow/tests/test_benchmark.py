@@ -0,0 +1,24 @@
+from pathlib import Path
+import sys
+import polars as pl
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmark import generate_workspace
+from profiling import Measurement
+from runner import Main
+
+
+def test_generated_workspace_is_imported_without_duplicates(tmp_path: Path):
+    generate_workspace(tmp_path, transactions=500, banks=2, rules=20)
+    assert len(list((tmp_path / "1_imports" / "bank" / "bank0").glob("*.csv"))) == 4
+
+    with Measurement() as measurement:
+        categorized = Main(tmp_path, stages=["rules"]).run()
+
+    balance_corrections = categorized.filter(
+        pl.col("desc").str.contains("Balance correction")
+    )
+    assert len(categorized) - len(balance_corrections) == 500
+    assert categorized["desc"].str.contains("amazon_product").any()
+    assert measurement.seconds > 0
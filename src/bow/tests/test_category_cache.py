@@ -0,0 +1,51 @@
+from pathlib import Path
+import sys
+import polars as pl
+from datetime import date
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from rule import Rule
+from rules_applier import RulesApplier
+from category_cache import CategoryCache
+from parser import bank_transaction_columns, transaction_id
+
+
+def get_transactions(n: int) -> pl.DataFrame:
+    partners = ["AMAZON EU", "Bauhaus", "REWE", "Cafe Bohne", None]
+    return pl.DataFrame(
+        {
+            "date": [date(2024, 1, 1 + i % 28) for i in range(n)],
+            "account": ["DKB"] * n,
+            "partner": [partners[i % len(partners)] for i in range(n)],
+            "desc": [f"order {i % 7}" for i in range(n)],
+            "classification": ["Ausgang"] * n,
+            "partner_iban": [None] * n,
+            "amount": [-1.0 - i % 3 for i in range(n)],
+        },
+        schema_overrides={"partner_iban": pl.String},
+    ).with_columns(transaction_id(bank_transaction_columns))
+
+
+def test_incremental_result_equals_full_apply(tmp_path: Path):
+    rules = [
+        Rule(category="expenses:amazon", partner=".*amazon.*"),
+        Rule(category="expenses:baumarkt", partner=".*bauhaus.*"),
+        Rule(category="expenses:order", desc="order 3"),
+    ]
+    cache = CategoryCache(tmp_path)
+    cache.apply(RulesApplier(rules), get_transactions(50))
+
+    changed_rules = [
+        Rule(category="expenses:coffee", partner="cafe"),
+        rules[0],
+        Rule(category="expenses:diy", partner=".*bauhaus.*"),
+        rules[2],
+        Rule(category="expenses:groceries", partner="rewe"),
+    ]
+    transactions = get_transactions(80)
+    incremental = cache.apply(RulesApplier(changed_rules), transactions)
+    full = RulesApplier(changed_rules).apply(transactions)
+
+    assert incremental.columns == full.columns
+    assert incremental.equals(full)
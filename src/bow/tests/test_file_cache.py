@@ -0,0 +1,32 @@
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import file_cache
+
+
+def test_cache_file_depends_on_content_and_parts(tmp_path: Path):
+    file = tmp_path / "export.csv"
+    file.write_text("a,b\n1,2\n", encoding="utf-8")
+    cache_dir = tmp_path / "cache"
+    first = file_cache.cache_file(cache_dir, file, ["1"], ".parquet")
+    assert first.parent == cache_dir
+    assert first.suffix == ".parquet"
+    assert file_cache.cache_file(cache_dir, file, ["1"], ".parquet") == first
+    assert file_cache.cache_file(cache_dir, file, ["2"], ".parquet") != first
+    file.write_text("a,b\n1,3\n", encoding="utf-8")
+    assert file_cache.cache_file(cache_dir, file, ["1"], ".parquet") != first
+
+
+def test_only_used_cache_files_are_kept(tmp_path: Path):
+    used = tmp_path / "used.json"
+    with file_cache.writing(used) as temp_file:
+        temp_file.write_text("{}", encoding="utf-8")
+    (tmp_path / "unused.json").write_text("{}", encoding="utf-8")
+    (tmp_path / "unused.parquet").write_text("", encoding="utf-8")
+    file_cache.remove_unused(tmp_path, [used, None], "*.json")
+    assert sorted(file.name for file in tmp_path.iterdir()) == [
+        "unused.parquet",
+        "used.json",
+    ]
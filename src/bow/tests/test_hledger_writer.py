@@ -0,0 +1,70 @@
+from pathlib import Path
+import sys
+import polars as pl
+from datetime import date
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from hledger_writer import HledgerWriter
+
+
+def get_transactions() -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "date": [date(2023, 12, 30), date(2024, 1, 2), date(2024, 1, 5)],
+            "desc": ["gift\nfor mum", None, "salary"],
+            "amount": [-25.0, -3.2, 2000.0],
+            "account1": ["account:DKB", "account:DKB", "account:N26"],
+            "account2": ["expenses:gifts", "expenses:coffee", "incomes:salary"],
+            "transaction_id": pl.Series([3, 1, 2], dtype=pl.UInt64),
+        }
+    )
+
+
+def test_journal_per_year(tmp_path: Path):
+    HledgerWriter(tmp_path).write(get_transactions())
+    assert (tmp_path / "main.journal").read_text() == (
+        "include 2023.journal\ninclude 2024.journal\n"
+    )
+    assert (tmp_path / "2023.journal").read_text(encoding="utf-8") == (
+        "2023-12-30 gift for mum\n"
+        "    ; transaction_id:3\n"
+        "    account:DKB  -25.0 €\n"
+        "    expenses:gifts\n\n"
+    )
+
+
+def test_unchanged_years_are_kept_and_new_transactions_appended(tmp_path: Path):
+    transactions = get_transactions()
+    HledgerWriter(tmp_path).write(transactions.head(2))
+    journal_2023 = (tmp_path / "2023.journal").stat().st_mtime_ns
+    HledgerWriter(tmp_path).write(transactions)
+    assert (tmp_path / "2023.journal").stat().st_mtime_ns == journal_2023
+
+    appended = (tmp_path / "2024.journal").read_text(encoding="utf-8")
+    HledgerWriter(tmp_path / "full").write(transactions)
+    assert appended == (tmp_path / "full" / "2024.journal").read_text(encoding="utf-8")
+
+
+def test_missing_fields_are_left_out(tmp_path: Path):
+    transactions = get_transactions().with_columns(
+        amount=pl.Series([None, -3.2, 2000.0]),
+        account2=pl.Series(["expenses:gifts", None, "incomes:salary"]),
+    )
+    HledgerWriter(tmp_path).write(transactions)
+    assert (tmp_path / "2023.journal").read_text(encoding="utf-8") == (
+        "2023-12-30 gift for mum\n"
+        "    ; transaction_id:3\n"
+        "    account:DKB\n"
+        "    expenses:gifts\n\n"
+    )
+    assert (
+        (tmp_path / "2024.journal")
+        .read_text(encoding="utf-8")
+        .startswith(
+            "2024-01-02 \n"
+            "    ; transaction_id:1\n"
+            "    account:DKB  -3.2 €\n\n"
+            "2024-01-05 salary\n"
+        )
+    )
@@ -0,0 +1,60 @@
+from pathlib import Path
+import sys
+import polars as pl
+from datetime import date
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from manual_store import ManualStore
+
+
+def get_manual() -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "date": [date(2024, 1, 2), date(2024, 1, 3)],
+            "account": ["DKB", "DKB"],
+            "partner": ["Cafe Bohne", None],
+            "desc": ["Kaffee", "irgendwas"],
+            "classification": [None, "Ausgang"],
+            "partner_iban": [None, None],
+            "amount": [-3.2, -7.77],
+            "account1": ["account:DKB", "account:DKB"],
+            "account2": ["expenses:coffee", "expenses:misc"],
+            # larger than the largest signed 64 bit integer
+            "transaction_id": pl.Series([2**64 - 5, 42], dtype=pl.UInt64),
+        },
+        schema_overrides={
+            "partner": pl.String,
+            "classification": pl.String,
+            "partner_iban": pl.String,
+        },
+    )
+
+
+def test_only_changed_categories_are_upserted(tmp_path: Path):
+    store = ManualStore(tmp_path / "manual.sqlite")
+    manual = get_manual()
+    assert store.upsert(manual) == 2
+    assert store.upsert(manual) == 0
+
+    changed = manual.with_columns(
+        account2=pl.when(pl.col("transaction_id") == 42)
+        .then(pl.lit("expenses:other"))
+        .otherwise(pl.col("account2"))
+    )
+    assert store.upsert(changed) == 1
+    assert store.read().sort("date").equals(changed)
+
+    assert store.delete(pl.Series([2**64 - 5], dtype=pl.UInt64)) == 1
+    assert store.read()["transaction_id"].to_list() == [42]
+
+
+def test_replace_sets_id_version(tmp_path: Path):
+    store = ManualStore(tmp_path / "manual.sqlite")
+    assert store.id_version() is None
+    store.upsert(get_manual())
+
+    rekeyed = get_manual().with_columns(pl.col("transaction_id") + 1)
+    assert store.replace(rekeyed, id_version="2, polars 1.0.0") == 2
+    assert store.id_version() == "2, polars 1.0.0"
+    assert store.read().sort("date").equals(rekeyed)
@@ -0,0 +1,38 @@
+from pathlib import Path
+import sys
+import polars as pl
+from datetime import date
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from output_writer import OutputWriter
+
+
+def test_partitioned_output_can_be_read_back(tmp_path: Path):
+    transactions = pl.DataFrame(
+        {
+            "date": [date(2023, 5, 1), date(2024, 1, 2), date(2024, 3, 4)],
+            "account": ["N26 Haupt/konto", "DKB", "DKB"],
+            "amount": [-1.5, 20.0, -3.0],
+        }
+    )
+    OutputWriter(tmp_path, ["csv", "parquet", "ipc"]).write(transactions)
+    OutputWriter(tmp_path, ["parquet", "ipc"]).write(transactions)
+
+    assert (tmp_path / "output.csv").exists()
+    parquet = pl.scan_parquet(tmp_path / "parquet", hive_partitioning=True)
+    ipc = pl.scan_ipc(tmp_path / "ipc" / "**" / "*.arrow", hive_partitioning=True)
+    for scan in [parquet, ipc]:
+        read = scan.select(transactions.columns).sort("date").collect()
+        assert read.equals(transactions)
+        dkb_2024 = scan.filter((pl.col("year") == 2024) & (pl.col("account") == "DKB"))
+        assert dkb_2024.collect()["amount"].to_list() == [20.0, -3.0]
+
+    # as if a run stopped between moving the old output aside and moving the new one in place
+    (tmp_path / "parquet").rename(tmp_path / "parquet.old")
+    OutputWriter(tmp_path, ["parquet"]).write(transactions)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "ipc",
+        "output.csv",
+        "parquet",
+    ]
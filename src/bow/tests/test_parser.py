@@ -5,36 +5,169 @@ from datetime import datetime
 
 sys.path.append(str(Path(__file__).parent.parent))
 
-from parser import Parser
+from parser import (
+    TRANSACTION_ID_VERSION,
+    ConfigFileBasedParser,
+    Parser,
+    bank_transaction_columns,
+    read_csv_in_batches,
+    transaction_id,
+)
 
 
 class TestParser(Parser):
-    def __init__(
-        self,
-        names_to_unique_konto_names: dict[str, str] = {},
-        konto_names_to_iban: dict[str, str] = {},
-    ):
-        super().__init__(names_to_unique_konto_names, konto_names_to_iban)
-
     def parse_single_file(self, file: Path) -> pl.DataFrame:
-        return pl.read_csv(file, try_parse_dates=True)
+        return pl.read_csv(file, try_parse_dates=True).rename(
+            {
+                "datum": "date",
+                "konto": "account",
+                "gegenstelle": "partner",
+                "zweck": "desc",
+                "kategorie": "classification",
+                "iban_gegenstelle": "partner_iban",
+                "betrag": "amount",
+            }
+        )
 
 
 def test_overlapping_timeranges_same_account_are_filtered():
-    parser = TestParser()
     folder = Path(__file__).parent / "test_files" / "unique_account"
-    df = parser.parse(folder)
+    df = TestParser(folder).parse()
     assert len(df) == 33
     assert df.unique().shape[0] == 33
-    assert df["datum"].min() == datetime(2001, 11, 30).date()
-    assert df["datum"].max() == datetime(2003, 8, 25).date()
+    assert df["date"].min() == datetime(2001, 11, 30).date()
+    assert df["date"].max() == datetime(2003, 8, 25).date()
 
 
 def test_overlapping_timeranges_different_accounts_are_not_filtered():
-    parser = TestParser()
     folder = Path(__file__).parent / "test_files" / "multiple_accounts_complete_overlap"
-    df = parser.parse(folder)
+    df = TestParser(folder).parse()
     assert len(df) == 46
     assert df.unique().shape[0] == 46
-    assert df["datum"].min() == datetime(2001, 11, 30).date()
-    assert df["datum"].max() == datetime(2003, 1, 3).date()
+    assert df["date"].min() == datetime(2001, 11, 30).date()
+    assert df["date"].max() == datetime(2003, 1, 3).date()
+
+
+def test_transaction_ids_are_unique_for_identical_transactions():
+    folder = Path(__file__).parent / "test_files" / "unique_account"
+    df = TestParser(folder).parse()
+    doubled = pl.concat([df, df])
+    ids = doubled.select(transaction_id(bank_transaction_columns))["transaction_id"]
+    assert ids.dtype == pl.UInt64
+    assert ids.n_unique() == len(doubled)
+    assert df["transaction_id"].is_in(ids).all()
+
+
+def test_transaction_ids_depend_on_content_and_occurrence_only():
+    transactions = pl.DataFrame(
+        {
+            "date": [datetime(2024, 1, 1).date()] * 3,
+            "account": ["DKB", "DKB", "DKB"],
+            "partner": ["AMAZON EU", "AMAZON EU", "Bauhaus"],
+            "desc": ["order 123", "order 123", None],
+            "classification": ["Ausgang", "Ausgang", "Ausgang"],
+            "partner_iban": [None, None, None],
+            "amount": [-12.5, -12.5, -3.0],
+        },
+        schema_overrides={"partner_iban": pl.String},
+    )
+    ids = transactions.select(transaction_id(bank_transaction_columns)).to_series()
+    # e.g. the files of a folder are cached and given ids on their own
+    assert ids.head(2).to_list() == (
+        transactions.head(2)
+        .select(transaction_id(bank_transaction_columns))
+        .to_series()
+        .to_list()
+    )
+    reversed_ids = (
+        transactions.reverse().select(transaction_id(bank_transaction_columns))
+    ).to_series()
+    assert sorted(ids) == sorted(reversed_ids)
+    # the ids use the hash of polars, so stored ids are matched again after updating it
+    assert TRANSACTION_ID_VERSION.endswith(pl.__version__)
+
+
+def test_identical_transactions_are_deduplicated_as_multiset():
+    folder = Path(__file__).parent / "test_files" / "identical_transactions"
+    df = TestParser(folder).parse()
+    coffees = df.filter(pl.col("partner") == "Cafe Bohne")
+    assert len(coffees.filter(pl.col("date") == datetime(2024, 1, 2).date())) == 3
+    assert len(coffees.filter(pl.col("date") == datetime(2024, 1, 31).date())) == 1
+    # lies within the timerange of the first file, but is not contained in it
+    assert len(df.filter(pl.col("partner") == "Baumarkt")) == 1
+    assert len(df) == 7
+    assert df["transaction_id"].n_unique() == 7
+
+
+def test_parsed_files_are_loaded_from_cache(tmp_path: Path):
+    folder = Path(__file__).parent / "test_files" / "unique_account"
+    parsed = []
+
+    class CountingParser(TestParser):
+        def parse_single_file(self, file: Path) -> pl.DataFrame:
+            parsed.append(file)
+            return super().parse_single_file(file)
+
+    first = CountingParser(folder, cache_dir=tmp_path).parse()
+    parsed_files = len(parsed)
+    second = CountingParser(folder, cache_dir=tmp_path).parse()
+    assert parsed_files == len(list(folder.glob("*.csv")))
+    assert len(parsed) == parsed_files
+    assert first.equals(second)
+    assert len(list(tmp_path.glob("*.parquet"))) == parsed_files
+
+
+def test_streaming_import_gives_same_result():
+    folder = Path(__file__).parent / "test_files" / "utf16_account"
+    parser = ConfigFileBasedParser(folder)
+    eager = parser.parse()
+    parser.config["streaming"] = {"memory_limit_mb": 0.0003}
+    streamed = parser.parse()
+    assert len(eager) == 23
+    assert eager["partner"].str.contains("ü").any()
+    assert streamed.equals(eager)
+
+
+def test_batches_count_rows_like_whole_file(tmp_path: Path):
+    file = tmp_path / "export.csv"
+    file.write_text(
+        "Kontoauszug\nexportiert am 1.2.2024\nzweck,betrag\n"
+        + "".join(f'"zeile {i}\nmit umbruch",{i}\n' for i in range(20)),
+        encoding="utf-8",
+    )
+    args = {
+        "skip_rows": 2,
+        "skip_rows_after_header": 3,
+        "n_rows": 12,
+        "row_index_name": "row",
+        "row_index_offset": 100,
+    }
+    whole = pl.read_csv(file, **args)
+    batched = pl.concat(read_csv_in_batches(file, batch_bytes=30, **args))
+    assert len(whole) == 12
+    assert batched.equals(whole)
+
+
+def test_streaming_import_replaces_invalid_bytes_like_eager_import(tmp_path: Path):
+    folder = tmp_path / "imports" / "bank"
+    folder.mkdir(parents=True)
+    config = (Path(__file__).parent / "test_files" / "utf16_account").joinpath(
+        "parser_config.yml"
+    )
+    (folder / "parser_config.yml").write_text(
+        config.read_text(encoding="utf-8").replace("UTF-16", "utf8-lossy"),
+        encoding="utf-8",
+    )
+    (folder / "2023.csv").write_bytes(
+        "Buchungstag;Empfänger;Verwendungszweck;Betrag\n".encode("utf-8")
+        + b"".join(
+            f"0{i}.01.2023;B\xe4ckerei;Buchung {i};-{i},00\n".encode("latin-1")
+            for i in range(1, 10)
+        )
+    )
+    parser = ConfigFileBasedParser(folder)
+    eager = parser.parse()
+    parser.config["streaming"] = {"memory_limit_mb": 0.0001}
+    streamed = parser.parse()
+    assert eager["partner"].to_list() == ["B�ckerei"] * 9
+    assert streamed.equals(eager)
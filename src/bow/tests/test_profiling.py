@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from profiling import Trace
+
+
+def test_trace_nests_spans_also_across_threads(tmp_path: Path):
+    trace = Trace()
+    with trace.span("disabled") as span:
+        span["rows_out"] = 1
+    assert trace.spans == []
+
+    def span_in_thread(name: str, parent: dict | None):
+        with trace.span(name, parent):
+            pass
+
+    trace.enable()
+    with trace.span("stage", rows_in=3) as stage:
+        with trace.span("step") as step:
+            step["rows_out"] = 2
+        with ThreadPoolExecutor(1) as executor:
+            executor.submit(span_in_thread, "in thread", stage).result()
+            executor.submit(span_in_thread, "no parent", None).result()
+    trace.write(tmp_path / "profile.json")
+
+    spans = json.loads((tmp_path / "profile.json").read_text())["spans"]
+    assert [(span["name"], span["parent"]) for span in spans] == [
+        ("stage", None),
+        ("step", 0),
+        ("in thread", 0),
+        ("no parent", None),
+    ]
+    assert spans[0]["rows_in"] == 3 and spans[1]["rows_out"] == 2
+    assert spans[0]["wall_seconds"] >= spans[1]["wall_seconds"] >= 0
+    assert spans[0]["peak_rss_mb"] > 0
@@ -0,0 +1,65 @@
+from pathlib import Path
+import json
+import sys
+import polars as pl
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from rule import Rule
+from rules_applier import RulesApplier
+from rule_overlaps import RuleOverlaps
+from tests.test_rules_applier import get_transactions
+
+
+def get_overlaps(chunk_rows: int = 1 << 16) -> RuleOverlaps:
+    rules = [
+        Rule(category="expenses:amazon", partner=".*amazon.*"),
+        Rule(category="expenses:other", amount="^[-].*"),
+        Rule(category="expenses:shopping", partner=".*amazon.*"),
+        Rule(category="incomes:salary", desc="salary"),
+    ]
+    return RuleOverlaps(RulesApplier(rules), get_transactions(), chunk_rows=chunk_rows)
+
+
+def test_match_matrix_agrees_with_profile():
+    applier = RulesApplier(
+        [
+            Rule(category="expenses:amazon", partner=".*amazon.*"),
+            Rule(category="expenses:other", amount="^[-].*"),
+            Rule(category="expenses:never", partner=".*amazon.*"),
+        ]
+    )
+    overlaps = RuleOverlaps(applier, get_transactions())
+    profile = applier.profile(get_transactions())
+    assert overlaps.matched.tolist() == profile["matched"].to_list()
+    assert overlaps.first_matched.tolist() == profile["first_matched"].to_list()
+
+
+def test_overlaps_shadowed_rules_and_conflicts():
+    overlaps = get_overlaps()
+    assert overlaps.overlaps().select("rule", "rule_b", "overlap").rows() == [
+        (0, 1, 1),
+        (0, 2, 1),
+        (1, 2, 1),
+    ]
+
+    shadowed = overlaps.shadowed_rules()
+    assert shadowed["rule"].to_list() == [2]
+    assert shadowed["shadowed_by"].to_list() == [[0, 1]]
+    assert shadowed["fully_covered_by"].to_list() == [[0, 1]]
+
+    conflicts = overlaps.conflicts()
+    assert conflicts["categories"].to_list() == [
+        ["expenses:amazon", "expenses:other", "expenses:shopping"]
+    ]
+    assert conflicts["transactions"].to_list() == [1]
+    assert "AMAZON EU" in conflicts["example"][0]
+
+
+def test_chunks_give_same_result(tmp_path: Path):
+    assert get_overlaps(chunk_rows=8).overlaps().equals(get_overlaps().overlaps())
+
+    get_overlaps(chunk_rows=8).write(tmp_path)
+    report = json.loads((tmp_path / "rule_overlaps.json").read_text(encoding="utf-8"))
+    assert report["multi_matched_transactions"] == 1
+    assert len(pl.read_csv(tmp_path / "rule_overlaps.csv")) == 3
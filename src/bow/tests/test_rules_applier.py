@@ -0,0 +1,148 @@
+from pathlib import Path
+import json
+import sys
+import polars as pl
+from datetime import date
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from rule import Rule
+from rules_applier import RulesApplier
+from rule_statistics import RuleStatistics
+from pattern_literals import required_literals
+
+
+def get_transactions() -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "date": [date(2024, 1, 1), date(2024, 2, 1), date(2024, 3, 1)],
+            "account": ["DKB", "DKB", "N26"],
+            "partner": ["AMAZON EU", "Bauhaus", None],
+            "desc": ["order 123", "kartenpreis", "salary"],
+            "classification": ["Ausgang", "Ausgang", "Eingang"],
+            "partner_iban": [None, None, None],
+            "amount": [-12.5, -3.0, 2000.0],
+        },
+        schema_overrides={"partner_iban": pl.String},
+    )
+
+
+def test_first_matching_rule_wins():
+    rules = [
+        Rule(category="expenses:amazon", partner=".*amazon.*"),
+        Rule(category="expenses:other", amount="^[-].*"),
+        Rule(category="expenses:never", partner=".*amazon.*"),
+    ]
+    result = RulesApplier(rules).apply(get_transactions())
+    assert result["account2"].to_list() == [
+        "expenses:amazon",
+        "expenses:other",
+        "incomes:unknown",
+    ]
+    assert result["account1"].to_list() == [
+        "account:DKB",
+        "account:DKB",
+        "account:N26",
+    ]
+
+
+def test_same_result_as_legacy_apply():
+    rules = [
+        Rule(category="expenses:bank", base=".*kartenpreis.*"),
+        Rule(category="incomes:salary", desc="salary", account=".*N26.*"),
+        Rule(category="expenses:2024", date_start=date(2024, 1, 15)),
+        Rule(category="expenses:amazon", partner="AMAZON"),
+    ]
+    transactions = get_transactions()
+    result = RulesApplier(rules).apply(transactions)
+    legacy = RulesApplier(rules).apply_legacy(transactions)
+    assert result["account2"].to_list() == legacy["account2"].to_list()
+
+
+def test_rule_index_is_null_without_match():
+    rules = [Rule(category="expenses:amazon", partner=".*amazon.*")]
+    result = get_transactions().select(RulesApplier(rules).rule_index_expression())
+    assert result.to_series().to_list() == [0, None, None]
+
+
+def test_required_literals():
+    assert required_literals(".*amazon.*") == ["amazon"]
+    assert required_literals(".*kartenpreis.*|.*depotgeb.*") == [
+        "depotgeb",
+        "kartenpreis",
+    ]
+    assert required_literals("(?:amazon|amzn)\\s*mktp") == ["mktp"]
+    assert required_literals("^[-].*") is None
+    assert required_literals(".*amazon.*|.*") is None
+    # e.g. an unquoted number in a rule file
+    assert required_literals(12345) is None
+
+
+def test_literal_prefilter_gives_same_result_as_expression():
+    rules = [
+        Rule(category="expenses:amazon", partner=".*Amazon eu.*"),
+        Rule(category="expenses:bank", base=".*KARTENPREIS.*|.*depotgeb.*"),
+        Rule(category="expenses:case", desc="Order", case_sensitive=True),
+        Rule(category="incomes:salary", desc="sal(ary|är)", amount="^[^-]"),
+        Rule(category="expenses:other", amount="^[-].*"),
+    ]
+    transactions = get_transactions()
+    applier = RulesApplier(rules)
+    result = applier.apply(transactions)
+    expected = transactions.select(applier.category_expression())
+    assert result["account2"].to_list() == expected.to_series().to_list()
+    assert result["account2"].to_list() == [
+        "expenses:amazon",
+        "expenses:bank",
+        "incomes:salary",
+    ]
+
+
+def test_profile_finds_dead_and_stealing_rules():
+    rules = [
+        Rule(category="expenses:all", amount="^[-].*"),
+        Rule(category="expenses:amazon", partner=".*amazon.*"),
+        Rule(category="incomes:salary", desc="salary"),
+    ]
+    applier = RulesApplier(rules)
+    profile = applier.profile(get_transactions())
+    assert profile["matched"].to_list() == [2, 1, 1]
+    assert profile["first_matched"].to_list() == [2, 0, 1]
+    assert profile["stolen"].to_list() == [1, 0, 0]
+    assert profile["dead"].to_list() == [False, True, False]
+    assert applier.rule_to_count["expenses:all"] == 2
+
+
+def test_profile_without_rules(tmp_path: Path):
+    profile = RulesApplier([]).profile(get_transactions())
+    assert profile.is_empty()
+    assert profile.columns[-1] == "dead"
+
+    RuleStatistics(profile).write(tmp_path)
+    report = json.loads((tmp_path / "rule_statistics.json").read_text(encoding="utf-8"))
+    assert report["rules"] == 0
+    assert report["dead_rules"] == []
+
+
+def test_amount_regexes_are_rewritten_to_numeric_predicates():
+    negative = Rule(category="expenses", amount="^[-].*")
+    assert negative.amount.pattern == ".*"
+    assert negative.amount_sign == "negative"
+    assert Rule(category="incomes", amount="^[^-].*").amount_min == 0.0
+
+
+def test_numeric_amount_predicates():
+    rules = [
+        Rule(category="expenses:exact", amount_exact=-3.001, amount_tolerance=0.01),
+        Rule(category="incomes:big", amount_min=1000, amount_sign="positive"),
+        Rule(category="expenses:small", amount_min=-20, amount_max=-10),
+    ]
+    transactions = get_transactions()
+    result = RulesApplier(rules).apply(transactions)
+    legacy = RulesApplier(rules).apply_legacy(transactions)
+    assert result["account2"].to_list() == [
+        "expenses:small",
+        "expenses:exact",
+        "incomes:big",
+    ]
+    assert legacy["account2"].to_list() == result["account2"].to_list()
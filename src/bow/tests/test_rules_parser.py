@@ -0,0 +1,60 @@
+from pathlib import Path
+import sys
+from datetime import date
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from rules_parser import RulesParser
+
+
+def test_defaults_and_cached_rules(tmp_path: Path):
+    rules_folder = tmp_path / "2_rules"
+    rules_folder.mkdir()
+    (rules_folder / "expenses.yml").write_text(
+        """
+defaults:
+  amount: "^[-].*"
+rules:
+  - category: expenses:amazon
+    partner: ".*amazon.*"
+  - category: incomes:refund
+    partner: ".*amazon.*"
+    amount: ".*"
+    date_begin: 2024-01-01
+""",
+        encoding="utf-8",
+    )
+    cache_dir = tmp_path / "cache"
+
+    rules = RulesParser(cache_dir).parse(rules_folder)
+    assert [rule.amount_sign for rule in rules] == ["negative", None]
+    assert rules[1].date_start == date(2024, 1, 1)
+
+    (cache_file,) = cache_dir.iterdir()
+    assert cache_file.suffix == ".json"
+    cached_rules = RulesParser(cache_dir).parse(rules_folder)
+    assert cached_rules == rules
+    assert cached_rules[1].date_start == date(2024, 1, 1)
+    assert cached_rules[0].partner.match("AMAZON EU")
+
+    (rules_folder / "expenses.yml").write_text(
+        "rules:\n  - category: expenses:other\n", encoding="utf-8"
+    )
+    RulesParser(cache_dir).parse(rules_folder)
+    assert cache_file not in list(cache_dir.iterdir())
+
+
+def test_invalid_rules_fail_while_parsing(tmp_path: Path):
+    for rule, error in [
+        ('partner: "(?<=amazon) eu"', "Invalid partner pattern"),
+        ('desc: "[a-"', "Invalid desc pattern"),
+        ("partnr: amazon", "partnr"),
+        ("partner: 12345", "Invalid partner pattern 12345.*must be strings"),
+    ]:
+        (tmp_path / "rules.yml").write_text(
+            f"rules:\n  - category: expenses:ok\n  - category: expenses:bad\n    {rule}\n",
+            encoding="utf-8",
+        )
+        with pytest.raises(ValueError, match=f"Rule 2 in .*rules.yml.*{error}"):
+            RulesParser().parse(tmp_path)
@@ -0,0 +1,58 @@
+from pathlib import Path
+import shutil
+import sys
+import polars as pl
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmark import generate_workspace
+from runner import Main
+
+
+def test_lazy_run_gives_same_result_as_eager_run(tmp_path: Path):
+    eager_dir, lazy_dir = tmp_path / "eager", tmp_path / "lazy"
+    generate_workspace(eager_dir, transactions=500, banks=2, rules=20)
+    Main(eager_dir, stages=["manual"]).run()
+    todo_file = eager_dir / "3_manual" / "todo.csv"
+    todo = pl.read_csv(todo_file, schema_overrides={"transaction_id": pl.UInt64})
+    todo.with_columns(
+        account2=pl.when(pl.int_range(pl.len()) < 3)
+        .then(pl.lit("expenses:manual"))
+        .otherwise(pl.col("account2"))
+    ).write_csv(todo_file)
+    shutil.copytree(eager_dir, lazy_dir)
+
+    eager = Main(eager_dir, stages=["output"]).run_stages()
+    lazy = Main(lazy_dir, stages=["output"], lazy=True).run_stages()
+
+    assert isinstance(lazy["rules"], pl.LazyFrame)
+    assert lazy["manual"].equals(eager["manual"])
+    assert (lazy["manual"]["account2"] == "expenses:manual").sum() == 3
+    for file in ["3_manual/todo.csv", "3_manual/done.csv", "4_output/output.csv"]:
+        assert (lazy_dir / file).read_bytes() == (eager_dir / file).read_bytes()
+
+
+def test_category_in_todo_wins_over_uncategorized_done(tmp_path: Path):
+    shutil.copytree(
+        Path(__file__).parent / "test_files" / "utf16_account",
+        tmp_path / "1_imports" / "bank" / "utf16_account",
+    )
+    Main(tmp_path, stages=["manual"]).run()
+    todo_file = tmp_path / "3_manual" / "todo.csv"
+    done_file = tmp_path / "3_manual" / "done.csv"
+    todo = pl.read_csv(todo_file, schema_overrides={"transaction_id": pl.UInt64})
+    transaction = todo.head(1)
+
+    # the same transaction categorized in todo.csv, but uncategorized in done.csv
+    todo.with_columns(
+        account2=pl.when(pl.int_range(pl.len()) == 0)
+        .then(pl.lit("expenses:manual"))
+        .otherwise(pl.col("account2"))
+    ).write_csv(todo_file)
+    transaction.write_csv(done_file)
+    categorized = Main(tmp_path, stages=["manual"]).run()
+
+    done = pl.read_csv(done_file, schema_overrides={"transaction_id": pl.UInt64})
+    assert done["transaction_id"].to_list() == transaction["transaction_id"].to_list()
+    assert done["account2"].to_list() == ["expenses:manual"]
+    assert (categorized["account2"] == "expenses:manual").sum() == 1
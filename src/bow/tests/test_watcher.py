@@ -0,0 +1,38 @@
+from pathlib import Path
+import shutil
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from runner import Main
+from watcher import Watcher
+
+
+def write_rules(working_dir: Path, category: str):
+    (working_dir / "2_rules" / "rules.yml").write_text(
+        f'rules:\n  - category: {category}\n    partner: "Stadtwerke"\n',
+        encoding="utf-8",
+    )
+
+
+def test_watcher_reruns_only_affected_stages(tmp_path: Path):
+    shutil.copytree(
+        Path(__file__).parent / "test_files" / "utf16_account",
+        tmp_path / "1_imports" / "bank" / "utf16_account",
+    )
+    (tmp_path / "2_rules").mkdir()
+    write_rules(tmp_path, "expenses:energy")
+
+    watcher = Watcher(Main(tmp_path, stages=["output"]))
+    assert watcher.update() == "import"
+    assert watcher.update() is None
+    imported = watcher.results["import"]
+
+    write_rules(tmp_path, "expenses:electricity")
+    assert watcher.update() == "rules"
+    assert watcher.results["import"] is imported
+    assert "expenses:electricity" in (tmp_path / "4_output" / "output.csv").read_text(
+        encoding="utf-8"
+    )
+    # the files written by the manual stage itself are no changes
+    assert watcher.update() is None
@@ -0,0 +1,101 @@
+from pathlib import Path
+import time
+import traceback
+import polars as pl
+
+# the first stage whose transactions change with the files in these paths of the working dir
+FIRST_AFFECTED_STAGE = {
+    "config.yml": "import",
+    "1_imports": "import",
+    "2_rules": "rules",
+    "3_manual": "manual",
+}
+DATA_STAGES = ["import", "rules", "manual"]
+
+
+class Watcher:
+    """
+    Keeps the transactions after the stages import, rules and manual of main (a runner.Main) in memory
+    and polls its working dir for changed files. A change reruns only the stages from the first one it
+    affects, e.g. editing a rule reuses the imported transactions, and editing todo.csv the categorized ones.
+
+    The files the manual stage writes itself (todo.csv, done.csv and its database) do not count as changes.
+    """
+
+    def __init__(self, main, interval: float = 0.5):
+        self.main = main
+        self.interval = interval
+        # None until the first update, which runs all stages
+        self.results: dict[str, pl.DataFrame] | None = None
+        self.snapshot = self._snapshot(FIRST_AFFECTED_STAGE)
+
+    def watch(self):
+        self.update()
+        print(f"Watching {self.main.working_dir} for changes, stop with Ctrl+C..")
+        try:
+            while True:
+                time.sleep(self.interval)
+                self.update()
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+
+    def update(self) -> str | None:
+        """
+        Reruns the stages affected by the changes since the last update and returns the first of them.
+        """
+        snapshot = self._snapshot(FIRST_AFFECTED_STAGE)
+        changed = sorted(
+            path
+            for path in snapshot.keys() | self.snapshot.keys()
+            if snapshot.get(path) != self.snapshot.get(path)
+        )
+        self.snapshot = snapshot
+
+        first_stage = min(
+            (FIRST_AFFECTED_STAGE[path.parts[0]] for path in changed),
+            key=DATA_STAGES.index,
+            default="import" if self.results is None else None,
+        )
+        if first_stage is None:
+            return None
+
+        if changed:
+            print(f"Changed: {', '.join(str(path) for path in changed)}")
+        if Path("config.yml") in changed:
+            self.main.read_config()
+        self.results = {
+            stage: transactions
+            for stage, transactions in (self.results or {}).items()
+            if DATA_STAGES.index(stage) < DATA_STAGES.index(first_stage)
+        }
+
+        start = time.perf_counter()
+        try:
+            self.results = self.main.run_stages(self.results)
+            print(f"    Updated in {(time.perf_counter() - start) * 1000:.0f} ms")
+        except Exception:
+            # e.g. a file saved while being edited, the next change runs the missing stages again
+            traceback.print_exc()
+        finally:
+            self.snapshot.update(self._snapshot(["3_manual"]))
+
+        return first_stage
+
+    def _snapshot(self, paths) -> dict[Path, tuple[int, int]]:
+        """
+        Returns modification time and size of all files in paths, relative to the working dir.
+        """
+        snapshot = {}
+        for path in paths:
+            path = self.main.working_dir / path
+            for file in [path] if path.is_file() else path.rglob("*"):
+                try:
+                    stat = file.stat()
+                except FileNotFoundError:
+                    continue
+                if file.is_file():
+                    snapshot[file.relative_to(self.main.working_dir)] = (
+                        stat.st_mtime_ns,
+                        stat.st_size,
+                    )
+        return snapshot